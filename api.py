@@ -0,0 +1,71 @@
+"""JSON query API over the loaded datasets, served under /api/v1 by app.py.
+
+Answers are looked up in the structures every Dataset builds once per data version, a country
+through its row offsets and a batch of countries and years in the year by country pivot array,
+so no request scans or parses the data files.
+"""
+import numpy as np
+
+from indices import INDICES
+
+API_PREFIX = '/api/v1'
+# Largest batch of countries times years answered by one request
+MAX_CELLS = 100000
+
+
+def _number(value):
+    """JSON value of a float, null for NaN."""
+    return None if np.isnan(value) else float(value)
+
+
+def _rank(value):
+    return None if np.isnan(value) else int(value)
+
+
+def index_info(index, data):
+    return {'index': index.key, 'label': index.value_label, 'dataset': index.data_file, 'version': data.version}
+
+
+def country_series(datasets, code):
+    """Values, ranks and percentiles of the country in every year of every index, None if no index has it."""
+    indices = {}
+    name = None
+    for index in INDICES.values():
+        rows = datasets[index.key].country(code)
+        if not len(rows):
+            continue
+        name = rows['English name'].iloc[0]
+        indices[index.key] = dict(index_info(index, datasets[index.key]), series=[
+            {'year': int(year), 'value': _number(value), 'rank': _rank(rank), 'percentile': _number(percentile)}
+            for year, value, rank, percentile in zip(rows['Year'].tolist(), rows[index.value_column].tolist(),
+                                                     rows['Rank'].tolist(), rows['Percentile'].tolist())
+        ])
+    if not indices:
+        return None
+    return {'code': code, 'name': name, 'indices': indices}
+
+
+def value_matrix(index, data, codes, years):
+    """Values of the countries in the years as rows of codes by columns of years, null where unknown.
+
+    No codes or no years stand for all of them.
+    """
+    codes = codes or data.codes
+    years = years or data.years
+    values = data.values(codes, years)
+    return dict(index_info(index, data), codes=list(codes), years=[int(year) for year in years],
+                values=np.where(np.isnan(values), None, values).tolist())
+
+
+def year_ranking(index, data, year):
+    """Ranking of the countries in the year, best first, None if the year is not in the dataset."""
+    ranking = data.ranking(year)
+    if not len(ranking):
+        return None
+    codes = data.frame.loc[ranking.index, 'Code']
+    return dict(index_info(index, data), year=int(year), ranking=[
+        {'rank': _rank(rank), 'code': code, 'name': name, 'value': _number(value), 'percentile': _number(percentile)}
+        for rank, code, name, value, percentile in zip(
+            ranking['Rank'].tolist(), codes.tolist(), ranking['English name'].tolist(),
+            ranking[index.value_column].tolist(), ranking['Percentile'].tolist())
+    ])
@@ -3,54 +3,330 @@
 import dash
 import dash_core_components as dcc
 import dash_html_components as html
-import plotly.graph_objects as go
-import pandas as pd
-import numpy as np
 import pathlib
+import os
+import functools
+import hashlib
 
-from dash.dependencies import Input, Output
+from dash.dependencies import Input, Output, State, ClientsideFunction
 from urllib.parse import quote as urlquote
-from flask import Flask, send_from_directory, send_file
+from flask import Flask, send_file, request, Response, abort, jsonify
+from flask_compress import Compress
 
-from generators import generate_table, generate_world_map, generate_europe_map
+from api import API_PREFIX, MAX_CELLS, country_series, index_info, value_matrix, year_ranking
+from columnar import read_frame
+from correlation import Correlations, CORRELATION_FILE, POOLED
+from dataset import Countries, Dataset
+from downloads import DataIndex, EXPORT_FORMATS, export_formats, filter_rows, stream_export
+from generators import generate_table, figure_cache, table_cache, update_cache, cached_map, \
+    generate_paged_table, page_records, generate_year_arrays, cached_correlation_scatter, map_key, correlation_key, \
+    cached_year_update, map_entry, year_update_entry, correlation_entry, cached_animated_map, animated_map_entry, \
+    ANIMATED, response_cache
+from indices import DATA_DIR, INDICES
+from metrics import Metrics, CONTENT_TYPE, instrument_callbacks, memory_report, rss_bytes
+from responses import serve_cached_responses
+from shared_cache import SharedCache
+from snapshot import Reloader
+from warmup import WarmUp
 
 external_stylesheets = ['https://codepen.io/chriddyp/pen/bWLwgP.css']
 
-# Used dataset version names
-DATA_UN = 'eGov-t5.csv'
-DATA_EU = 'eur-t3.csv'
-
-df = pd.read_csv('data/{}'.format(DATA_UN))
-dfeu = pd.read_csv('data/{}'.format(DATA_EU))
-
-filtered_df = pd.DataFrame(df[df.Year == df['Year'].max()], columns=['English name', 'UN eGov index'])
-# Adding rank and percentile
-filtered_df['Rank'] = filtered_df['UN eGov index'].rank(method='min', ascending=False)
-filtered_df['Percentile'] = filtered_df['UN eGov index'].rank(pct=True)
-filtered_df['Percentile'] = (filtered_df['Percentile'] * 100).round(1).astype(str) + '%'
-filtered_df = filtered_df[['Rank', 'English name', 'UN eGov index', 'Percentile']]
-filtered_df = filtered_df.rename(columns={'English name': 'Country', 'UN eGov index': 'UN index value'})
-
-filtered_df_eu = pd.DataFrame(dfeu[dfeu.Year == dfeu['Year'].max()], columns=['English name', 'EU eGov index'])
-# Adding rank and percentile
-filtered_df_eu['Rank'] = filtered_df_eu['EU eGov index'].rank(method='min', ascending=False)
-filtered_df_eu['Percentile'] = filtered_df_eu['EU eGov index'].rank(pct=True)
-filtered_df_eu['Percentile'] = (filtered_df_eu['Percentile'] * 100).round(1).astype(str) + '%'
-filtered_df_eu = filtered_df_eu[['Rank', 'English name', 'EU eGov index', 'Percentile']]
-filtered_df_eu = filtered_df_eu.rename(columns={'English name': 'Country', 'EU eGov index': 'EU index value'})
+# Used dataset version names, the environment can point the app at other files such as synthetic.py datasets
+DATA_UN = INDICES['un'].data_file
+DATA_EU = INDICES['eu'].data_file
+
+# Opt-in: browse the full ranking in a server-side paged and sortable table instead of the static top 15
+PAGED_TABLES = os.environ.get('EGOV_PAGED_TABLES', '0') == '1'
+# Opt-in: ship the map data of all years to the browser once and swap it there when the slider moves
+CLIENTSIDE_MAPS = os.environ.get('EGOV_CLIENTSIDE_MAPS', '0') == '1'
+# Opt-out: send the whole map figure on every slider move instead of only the properties that change
+FULL_FIGURES = os.environ.get('EGOV_FULL_FIGURES', '0') == '1'
+# Opt-in: show maps that play all years as an animation in the browser, the slider then only selects the ranking year
+ANIMATED_MAPS = os.environ.get('EGOV_ANIMATED_MAPS', '0') == '1'
+# Opt-in: skip the figure warm-up and build the layout on the first request, so new workers start serving sooner
+LAZY_START = os.environ.get('EGOV_LAZY_START', '0') == '1'
+
+# Threads building the cache entries at startup, or forked processes with EGOV_WARMUP_PROCESSES=1
+WARMUP_WORKERS = int(os.environ.get('EGOV_WARMUP_WORKERS', '4'))
+WARMUP_PROCESSES = os.environ.get('EGOV_WARMUP_PROCESSES', '0') == '1'
+# Opt-in: SQLite file of a figure and table cache shared by all workers of the host, and its size limit
+SHARED_CACHE = os.environ.get('EGOV_SHARED_CACHE', '')
+SHARED_CACHE_MB = int(os.environ.get('EGOV_SHARED_CACHE_MB', '256'))
+# Opt-in: seconds between checks of the data files for changes, which are then loaded without a restart
+RELOAD_INTERVAL = float(os.environ.get('EGOV_RELOAD_INTERVAL', '0'))
+# Set by gunicorn.conf.py: the app is loaded once in the gunicorn master and forked into the workers,
+# which start the threads that do not survive a fork themselves, see after_fork
+PRELOADED = os.environ.get('EGOV_PRELOADED', '0') == '1'
+
+# Correlation statistics of the UN and EU indices, the view is only shown when their dataset is present
+CORRELATION_PATH = os.path.join(DATA_DIR, CORRELATION_FILE)
+
+
+def load_data(files, digests, previous):
+    """Loads the data of a new snapshot, reusing what the previous one loaded from files that did not change.
+
+    The datasets of all indices are partitioned by year and country and ranked once, callbacks then only
+    look the slices up. Their columns are held in compact dtypes, the country codes and names over the
+    categories of one Countries dimension table.
+    """
+    reused, frames = {}, {}
+    for index in INDICES.values():
+        data = previous.datasets[index.key] if previous is not None else None
+        if data is None or data.version != digests[index.key][:12]:
+            frames[index.key] = read_frame(files[index.key])
+        else:
+            reused[index.key] = data
+    countries = Countries(list(frames.values()) + [data.frame for data in reused.values()],
+                          previous.countries if previous is not None else None)
+    datasets = {
+        index.key: reused[index.key] if index.key in reused else Dataset(
+            countries.compact(frames[index.key]), index.data_file, index.value_column, digests[index.key][:12])
+        for index in INDICES.values()
+    }
+    correlations = Correlations(previous.correlations if previous is not None else None)
+    if digests['correlation'] is not None:
+        correlations.update(read_frame(files['correlation']))
+    return {'datasets': datasets, 'countries': countries, 'correlations': correlations}
+
+
+def figure_keys(snapshot):
+    """Figure cache keys of all data in the snapshot."""
+    keys = {map_key(index, snapshot.datasets[index.key]) for index in INDICES.values()}
+    if snapshot.correlations.years:
+        keys.update(correlation_key(snapshot.correlations, year) for year in [POOLED] + snapshot.correlations.years)
+    return keys
+
+
+def drop_replaced_data(previous, snapshot):
+    """Drops the cached figures and tables of the data that was replaced and picks up new downloadable files."""
+    for key in figure_keys(previous) - figure_keys(snapshot):
+        figure_cache.invalidate(key)
+        table_cache.invalidate(key)
+        update_cache.invalidate(key)
+        response_cache.invalidate(key)
+    data_index.refresh()
+    global warmup
+    warmup = warm_up(snapshot)
+
+
+if SHARED_CACHE:
+    figure_cache.shared = table_cache.shared = update_cache.shared = SharedCache(SHARED_CACHE, SHARED_CACHE_MB << 20)
+
+# Live data snapshot. Every request takes it once and uses only that version of the data, a reload builds
+# the new one next to it and swaps it in, see snapshot.py.
+reloader = Reloader(
+    dict([(index.key, index.path) for index in INDICES.values()] + [('correlation', CORRELATION_PATH)]),
+    load_data, drop_replaced_data)
+if RELOAD_INTERVAL > 0 and not PRELOADED:
+    reloader.watch(RELOAD_INTERVAL)
+
+
+def after_fork():
+    """Starts the per process state of a worker forked from the preloading master.
+
+    The data, the caches and the warm-up results are inherited from the master, only the file watch
+    thread is started again. The shared cache connects by itself in every process.
+    """
+    if RELOAD_INTERVAL > 0:
+        reloader.watch(RELOAD_INTERVAL)
+
+
+def format_ranking(ranking):
+    """Formats the numeric 0-1 percentile for display, only ever applied to the rows being rendered."""
+    return ranking.assign(Percentile=(ranking['Percentile'] * 100).round(1).astype(str) + '%')
+
+
+def ranking_table(index, data, year, paged=False, rows=15):
+    """Table of the precomputed ranking of the index in the given year, paged or only its top rows.
+
+    The top rows tables are cached like the maps, tables of other lengths than the default are built every time.
+    """
+    if paged:
+        labels = {'English name': 'Country', index.value_column: index.value_label}
+        return generate_paged_table(index.ranking_id, data.ranking(year), rows, format_ranking, labels)
+    cache, key, build, shared = top_table_entry(index, data, rows)
+    if rows != 15:
+        return build(year)
+    return cache.get(key, year, build, shared)
+
+
+def top_table_entry(index, data, rows=15):
+    """Cache, key, builder and sharing of the top rows tables of the index."""
+    labels = {'English name': 'Country', index.value_column: index.value_label}
+
+    def build(year):
+        return generate_table(format_ranking(data.ranking(year).iloc[:rows]).rename(columns=labels), rows)
+
+    return table_cache, map_key(index, data), build, data.version is not None
+
+
+def warmup_tasks(snapshot):
+    """Cache entries of the snapshot built by the warm-up, the maps, map updates and tables of every index
+    and year as far as the mode uses them, and the correlation scatters."""
+    entries = []
+    for index in INDICES.values():
+        data = snapshot.datasets[index.key]
+        if ANIMATED_MAPS:
+            # The one figure of all years replaces the maps and updates of single years
+            entries.append(('animated/{}'.format(index.key), animated_map_entry(index, data), ANIMATED))
+        kinds = [] if ANIMATED_MAPS else [('map', map_entry(index, data))]
+        if not (CLIENTSIDE_MAPS or FULL_FIGURES or ANIMATED_MAPS):
+            kinds.append(('update', year_update_entry(index, data)))
+        if not PAGED_TABLES:
+            kinds.append(('table', top_table_entry(index, data)))
+        # Latest year first, it is the one shown when the page loads
+        for year in reversed(data.years):
+            entries.extend(('{}/{}/{}'.format(kind, index.key, year), entry, year) for kind, entry in kinds)
+    for year in ([POOLED] + snapshot.correlations.years) if snapshot.correlations.years else []:
+        entries.append(('correlation/{}'.format(year), correlation_entry(snapshot.correlations, year), year))
+    return [(name, cache, key, year, build, shared) for name, (cache, key, build, shared), year in entries]
+
+
+def warm_up(snapshot):
+    """Starts building the cache entries of the snapshot in the background, unless in the lazy start mode.
+
+    Building the map figures is most of the callback cost, the app already serves meanwhile and
+    builds what is not warm yet on demand.
+    """
+    # The map callback responses are cached as they are first sent, one for every index and year
+    response_cache.reserve(sum(len(data.years) for data in snapshot.datasets.values()))
+    if LAZY_START:
+        return None
+    return WarmUp(warmup_tasks(snapshot), WARMUP_WORKERS, WARMUP_PROCESSES).start()
+
+
+warmup = warm_up(reloader.current)
+
 
 # Normally, Dash creates its own Flask server internally. By creating our own,
 # we can create a route for downloading files directly:
 server = Flask(__name__)
+# Compresses the Dash callback and layout responses, responses that are already encoded are left as they are
+Compress(server)
+
+# Indices by their dataset file name, as used by the figure and export routes
+DATASETS = {index.data_file: index for index in INDICES.values()}
+# Whitelisted index of the downloadable files in the data folder
+data_index = DataIndex(DATA_DIR)
+
+
+@server.route("/data/index.json")
+def data_files():
+    """Lists the downloadable files and the datasets and formats available for filtered exports."""
+    return jsonify(files=data_index.listing(), exports={'datasets': list(DATASETS), 'formats': export_formats()})
 
 
 @server.route("/data/<path:path>")
 def download(path):
-    """Downloads the desired file from the data folder."""
-    return send_file('data/' + path,
-                     mimetype='text/csv',
-                     attachment_filename=path,
-                     as_attachment=True)
+    """Downloads the desired file from the data folder, only files in the data index are served."""
+    if path not in data_index:
+        abort(404)
+    data_file = data_index[path]
+    # Range requests are answered from the file itself, full downloads from the precompressed variant
+    if request.accept_encodings['gzip'] and request.range is None:
+        body, etag = data_file.gzip()
+        response = Response(body, mimetype='text/csv')
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers.set('Content-Disposition', 'attachment', filename=data_file.name)
+        response.set_etag(etag)
+        response.last_modified = data_file.mtime
+        response.make_conditional(request)
+    else:
+        response = send_file(str(data_file.path.resolve()),
+                             mimetype='text/csv',
+                             download_name=data_file.name,
+                             as_attachment=True,
+                             conditional=True)
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@server.route("/export/<dataset>")
+def export(dataset):
+    """Streams the rows of a dataset, optionally filtered by year and country code, as csv or arrow."""
+    export_format = request.args.get('format', 'csv')
+    if dataset not in DATASETS:
+        abort(404)
+    if export_format not in export_formats():
+        abort(400)
+    try:
+        years = [int(year) for year in request.args.getlist('year')]
+    except ValueError:
+        abort(400)
+    rows = filter_rows(reloader.current.datasets[DATASETS[dataset].key], years, request.args.getlist('code'))
+    response = Response(stream_export(rows, export_format), mimetype=EXPORT_FORMATS[export_format])
+    response.headers.set('Content-Disposition', 'attachment',
+                         filename='{}-export.{}'.format(pathlib.Path(dataset).stem, export_format))
+    return response
+
+
+def api_response(build):
+    """JSON response of an API request, answered from the live snapshot.
+
+    The ETag stands for the data version and the request, so a client that already has the answer
+    gets a 304 without it being built again, and any data reload changes it.
+    """
+    snapshot = reloader.current
+    etag = hashlib.sha1('{} {}'.format(snapshot.version, request.full_path).encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        payload = build(snapshot.datasets)
+        if payload is None:
+            abort(404)
+        response = jsonify(payload)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def api_index(key):
+    if key not in INDICES:
+        abort(404)
+    return INDICES[key]
+
+
+def api_list(name):
+    """Values of a query parameter, given repeatedly or comma separated."""
+    return [value for values in request.args.getlist(name) for value in values.split(',') if value]
+
+
+@server.route(API_PREFIX + '/indices')
+def api_indices():
+    """Lists the indices with their years and number of countries."""
+    return api_response(lambda datasets: {'indices': [
+        dict(index_info(index, datasets[index.key]), years=datasets[index.key].years,
+             countries=len(datasets[index.key].codes))
+        for index in INDICES.values()]})
+
+
+@server.route(API_PREFIX + '/countries/<code>')
+def api_country(code):
+    """Series of the country across all indices and years."""
+    return api_response(lambda datasets: country_series(datasets, code.upper()))
+
+
+@server.route(API_PREFIX + '/<key>/matrix')
+def api_matrix(key):
+    """Values of a batch of countries (code=) in a batch of years (year=), all of them when left out."""
+    index = api_index(key)
+    codes = [code.upper() for code in api_list('code')]
+    try:
+        years = [int(year) for year in api_list('year')]
+    except ValueError:
+        abort(400)
+    data = reloader.current.datasets[index.key]
+    if len(codes or data.codes) * len(years or data.years) > MAX_CELLS:
+        abort(400)
+    return api_response(lambda datasets: value_matrix(index, datasets[index.key], codes, years))
+
+
+@server.route(API_PREFIX + '/<key>/rankings/<int:year>')
+def api_ranking(key, year):
+    """Ranking of the countries in the year."""
+    index = api_index(key)
+    return api_response(lambda datasets: year_ranking(index, datasets[index.key], year))
 
 
 # Download link generation
@@ -72,551 +348,679 @@ app = dash.Dash(__name__, external_stylesheets=external_stylesheets, server=serv
 
 server = app.server
 
-app.layout = html.Div(
-    children=[
-        html.Div(
-            [
-                html.Div(
-                    [
-                        html.Img(
-                            src='assets/Logo-text-en.png',
-                            draggable='False',
-                            id="logo",
-                            height='auto',
-                            width=220,
-                        ),
-                        html.Img(
-                            src='assets/CJSP_logo.png',
-                            draggable='False',
-                            id="logo-CJSP",
-                            height='auto',
-                            width=160,
-                        ),
-                    ],
-                    className="three columns",
-                ),
-                html.Div(
-                    [
-                        html.H3(
-                            "eGovernment index dashboard",
-                            style={"margin-bottom": "0px"},
-                        ),
-                        html.H5(
-                            "A simple overview of UN and EU eGovernment benchmark indices",
-                            style={"margin-top": "0px"}
-                        ),
-                        html.I(
-                            [
-                                "Created as part of a paper submission for the Cambridge Journal of Science and Policy "
-                                "by Marek Szeles and Anshumaan Krishnan Ayyangar, expanding on ",
-                                html.A(
-                                    "previous work done by the former",
-                                    href="https://github.com/Plavit/eGovernment-index-dashboard",
-                                    target="_blank"
-                                )
-                            ],
-                            style={"margin-top": "0px"}
-                        ),
-
-                    ],
-                    className="eight columns",
-                    id="title",
-                ),
-                html.Div(
-                    [
-                        html.A(
-                            html.Button("Contact the authors", id="contact-button"),
-                            href="mailto:marek.szeles@eforce.cvut.cz",
-                        )
-                    ],
-                    className="three columns",
-                    id="button",
-                ),
-            ],
-            id="header",
-            className="row flex-display",
-            style={"margin-bottom": "25px"},
-        ),
-
-        html.Div(
-            [
-                html.Div(
-                    [
-                        html.Div(
-                            [
-                                html.Div(
-                                    children=[
-                                        html.Img(
-                                            src=
-                                            "https://1000logos.net/wp-content/uploads/2018/01/united-nations-logo.png",
-                                            draggable='False',
-                                            id="logo_un",
-                                            height=150,
-                                            width='auto',
-                                        ),
-                                        html.Div(
-                                            [
-                                                html.H3(
-                                                    "UN eGovernment index"
-                                                ),
-                                                html.P(
-                                                    "The e-Government Development Index (EGDI) is being published by "
-                                                    "the United Nations since 2001. It is a composite indicator "
-                                                    "involving three components – Online Service Index(OSI), "
-                                                    "Telecommunication Infrastructure Index (TII) "
-                                                    "and Human Capital Index (HCI). The final index is calculated "
-                                                    "using the following formula:"
-                                                ),
-                                                html.I("EGDI = ⅓ × (OSI+TII+HCI)"
-                                                       ),
-                                                html.H6(
-                                                    "The three components of the index are defined like so: "
-                                                ),
-                                                html.Ul(
-                                                    [
-                                                        html.Li(
-                                                            "OSI is the normalised score between 0 and 1, which"
-                                                            " is equal to the difference of the "
-                                                            "actual total score and the lowest total score divided by "
-                                                            "the range of total score values for all countries. "
-                                                        ),
-                                                        html.Li(
-                                                            [
-                                                                "Each country’s TII is the arithmetic average of",
-                                                                html.Ul(
-                                                                    [
-                                                                        html.Li(
-                                                                            "Estimated internet users "
-                                                                            "per 100 inhabitants;",
-                                                                        ),
-                                                                        html.Li(
-                                                                            "Number of mobile subscribers "
-                                                                            "per 100 inhabitants;"
-                                                                        ),
-                                                                        html.Li(
-                                                                            "Active mobile broadband subscriptions"
-                                                                            "per 100 inhabitants;"
-                                                                        ),
-                                                                        html.Li(
-                                                                            "Number of fixed broadband subscriptions "
-                                                                            "per 100 inhabitants"
+# Per-worker metrics of the callbacks, figures, caches, data and memory, served by /metrics
+metrics = Metrics()
+instrument_callbacks(server, metrics, app.config.routes_pathname_prefix + '_dash-update-component', app.callback_map)
+for cache, kind in ((figure_cache, 'figure'), (table_cache, 'table'), (update_cache, 'update'),
+                    (response_cache, 'response')):
+    metrics.value('egov_{}_cache_hits_total'.format(kind), '{} cache lookups answered from the cache.'.format(
+        kind.capitalize()), lambda cache=cache: cache.hits, 'counter')
+    metrics.value('egov_{}_cache_misses_total'.format(kind), '{} cache lookups that built the entry.'.format(
+        kind.capitalize()), lambda cache=cache: cache.misses, 'counter')
+    metrics.value('egov_{}_cache_hit_ratio'.format(kind), 'Share of the {} cache lookups answered from the '
+                  'cache.'.format(kind), lambda cache=cache: cache.hits / (cache.hits + cache.misses)
+                  if cache.hits + cache.misses else None)
+    metrics.value('egov_{}_cache_entries'.format(kind), 'Entries held by the {} cache.'.format(kind),
+                  lambda cache=cache: len(cache))
+metrics.value('egov_shared_cache_hits_total', 'Shared cache lookups answered from the shared cache.',
+              lambda: figure_cache.shared.hits if figure_cache.shared is not None else None, 'counter')
+metrics.value('egov_shared_cache_misses_total', 'Shared cache lookups that were not in the shared cache.',
+              lambda: figure_cache.shared.misses if figure_cache.shared is not None else None, 'counter')
+metrics.value('egov_shared_cache_errors_total', 'Shared cache lookups and stores that failed and were skipped.',
+              lambda: figure_cache.shared.errors if figure_cache.shared is not None else None, 'counter')
+metrics.value('egov_warmup_total', 'Cache entries built by the warm-up of the live data.',
+              lambda: warmup.total if warmup is not None else None)
+metrics.value('egov_warmup_done', 'Cache entries the warm-up of the live data has built so far.',
+              lambda: warmup.done if warmup is not None else None)
+metrics.value('egov_warmup_seconds', 'Time the warm-up of the live data has taken so far.',
+              lambda: warmup.elapsed if warmup is not None else None)
+metrics.value('egov_data_bytes', 'Memory held by the datasets of the live data and the structures derived from them.',
+              lambda: memory_report(reloader.current.datasets, reloader.current.countries)['total'])
+metrics.value('egov_data_load_seconds', 'Time the last load of the data snapshot took.', lambda: reloader.load_seconds)
+metrics.value('egov_data_loads_total', 'Data snapshots loaded, including the initial one.',
+              lambda: reloader.reloads, 'counter')
+metrics.value('egov_process_resident_memory_bytes', 'Resident memory of the worker.', rss_bytes)
+
+
+@server.route("/metrics")
+def metrics_text():
+    """Serves the metrics of this worker in the Prometheus text format."""
+    return Response(metrics.render(), content_type=CONTENT_TYPE)
+
+
+def map_panel(index, data):
+    """Year slider and map of the index, with the map data of all years in the CLIENTSIDE_MAPS mode and
+    the map of all years as an animation in the ANIMATED_MAPS mode."""
+    first, latest = data.years[0], data.years[-1]
+    return html.Div(
+        children=[
+            html.Label(
+                html.H6('Choose year for visualisation')
+            ),
+            dcc.Slider(
+                id=index.slider_id,
+                min=first,
+                max=latest,
+                value=latest,
+                marks={str(year): 'Year {}'.format(year) if year == first else str(year) for year in data.years},
+                step=None,
+                className='slider'
+            ),
+
+            dcc.Graph(id=index.graph_id,
+                      figure=cached_animated_map(index, data) if ANIMATED_MAPS else cached_map(index, data, latest)),
+            dcc.Store(id=index.store_id, data=generate_year_arrays(data, index.title) if CLIENTSIDE_MAPS else None),
+            dcc.Store(id=index.update_id),
+
+        ],
+        className="pretty_container ten columns",
+    )
+
+
+def ranking_panel(index, data, paged=False):
+    """Ranking of the index in its latest year, paged or its top rows, and the download of its dataset."""
+    latest = data.years[-1]
+    return html.Div(
+        [
+            html.Div(
+                children=[
+                    html.H4(
+                        id=index.title_id,
+                        children='TOP 15 countries in ' + str(latest)),
+                    html.Div(
+                        id=index.table_id,
+                        children=[
+                            ranking_table(index, data, latest, paged)
+                        ], style={'columnCount': 1}),
+                    html.Div(
+                        children=[
+                            file_download_link(index.data_file)
+                        ]
+                    )
+                ],
+                className="pretty_container",
+            ),
+        ],
+        className="three columns right-column",
+    )
+
+
+def correlation_statistics(correlations, year):
+    """Summary of the correlation statistics and outliers of the year, 0 for all years pooled."""
+    statistics = correlations.statistics(year)
+    outliers = correlations.outliers(year)
+    return [
+        html.H6('{} countries'.format(statistics['count']) if year != POOLED
+                else '{} country scores over {} years'.format(statistics['count'], len(correlations.years))),
+        html.P('Pearson correlation: {:.3f}'.format(statistics['pearson'])),
+        html.P('Spearman correlation: {:.3f}'.format(statistics['spearman'])),
+        html.P('Least squares fit: UN = {:.3f} × EU + {:.3f}'.format(statistics['slope'], statistics['intercept'])),
+        html.P('Outliers: ' + (', '.join(outliers) if outliers else 'none')),
+    ]
+
+
+def correlation_section(correlations):
+    """Scatter of the normalised UN and EU scores with a year selector and the statistics of the selected year."""
+    return html.Div(
+        [
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            html.Div(
+                                [
+                                    html.H3("Correlation of the UN and EU indices"),
+                                    html.P(
+                                        "Both indices are normalised to zero mean and unit variance over the countries "
+                                        "covered by both of them. The line is the least squares fit of the UN score on "
+                                        "the EU score, countries further than two standard errors from it are "
+                                        "highlighted as outliers."
+                                    ),
+                                ]
+                            )
+                        ],
+                        id="correlation_description",
+                        className="pretty_container description twelve columns flex-display"
+                    ),
+                    html.Div(
+                        [
+                            html.Div(
+                                children=[
+                                    html.Label(
+                                        html.H6('Choose year for visualisation')
+                                    ),
+                                    dcc.RadioItems(
+                                        id='correlation-year',
+                                        options=[{'label': 'All years', 'value': POOLED}] + [
+                                            {'label': str(year), 'value': year} for year in correlations.years],
+                                        value=POOLED,
+                                        labelStyle={'display': 'inline-block', 'margin-right': '15px'},
+                                    ),
+                                    dcc.Graph(id='correlation-scatter',
+                                              figure=cached_correlation_scatter(correlations, POOLED)),
+                                ],
+                                className="pretty_container ten columns",
+                            ),
+                            html.Div(
+                                [
+                                    html.Div(
+                                        id='correlation-statistics',
+                                        children=correlation_statistics(correlations, POOLED),
+                                        className="pretty_container",
+                                    ),
+                                ],
+                                className="three columns right-column",
+                            ),
+                        ],
+                        className="content_holder row twelve columns flex-display"
+                    ),
+                ],
+                className="pretty_container_bg twelve columns",
+            ),
+        ],
+        className="row flex-display",
+    )
+
+
+def correlation_placeholder():
+    """Hidden components of the correlation section for snapshots without correlation data, so the callback
+    registered for all snapshots always finds its inputs and outputs."""
+    return html.Div([dcc.RadioItems(id='correlation-year', options=[], value=POOLED),
+                     dcc.Graph(id='correlation-scatter'),
+                     html.Div(id='correlation-statistics')],
+                    style={'display': 'none'})
+
+
+def build_layout(snapshot, paged=PAGED_TABLES):
+    """Builds the component tree of the whole page from the data of the snapshot, with paged ranking tables
+    in the PAGED_TABLES mode unless paged is given."""
+    return html.Div(
+        children=[
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            html.Img(
+                                src='assets/Logo-text-en.png',
+                                draggable='False',
+                                id="logo",
+                                height='auto',
+                                width=220,
+                            ),
+                            html.Img(
+                                src='assets/CJSP_logo.png',
+                                draggable='False',
+                                id="logo-CJSP",
+                                height='auto',
+                                width=160,
+                            ),
+                        ],
+                        className="three columns",
+                    ),
+                    html.Div(
+                        [
+                            html.H3(
+                                "eGovernment index dashboard",
+                                style={"margin-bottom": "0px"},
+                            ),
+                            html.H5(
+                                "A simple overview of UN and EU eGovernment benchmark indices",
+                                style={"margin-top": "0px"}
+                            ),
+                            html.I(
+                                [
+                                    "Created as part of a paper submission for the Cambridge Journal of Science and Policy "
+                                    "by Marek Szeles and Anshumaan Krishnan Ayyangar, expanding on ",
+                                    html.A(
+                                        "previous work done by the former",
+                                        href="https://github.com/Plavit/eGovernment-index-dashboard",
+                                        target="_blank"
+                                    )
+                                ],
+                                style={"margin-top": "0px"}
+                            ),
+
+                        ],
+                        className="eight columns",
+                        id="title",
+                    ),
+                    html.Div(
+                        [
+                            html.A(
+                                html.Button("Contact the authors", id="contact-button"),
+                                href="mailto:marek.szeles@eforce.cvut.cz",
+                            )
+                        ],
+                        className="three columns",
+                        id="button",
+                    ),
+                ],
+                id="header",
+                className="row flex-display",
+                style={"margin-bottom": "25px"},
+            ),
+
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            html.Div(
+                                [
+                                    html.Div(
+                                        children=[
+                                            html.Img(
+                                                src=
+                                                "https://1000logos.net/wp-content/uploads/2018/01/united-nations-logo.png",
+                                                draggable='False',
+                                                id="logo_un",
+                                                height=150,
+                                                width='auto',
+                                            ),
+                                            html.Div(
+                                                [
+                                                    html.H3(
+                                                        "UN eGovernment index"
+                                                    ),
+                                                    html.P(
+                                                        "The e-Government Development Index (EGDI) is being published by "
+                                                        "the United Nations since 2001. It is a composite indicator "
+                                                        "involving three components – Online Service Index(OSI), "
+                                                        "Telecommunication Infrastructure Index (TII) "
+                                                        "and Human Capital Index (HCI). The final index is calculated "
+                                                        "using the following formula:"
+                                                    ),
+                                                    html.I("EGDI = ⅓ × (OSI+TII+HCI)"
+                                                           ),
+                                                    html.H6(
+                                                        "The three components of the index are defined like so: "
+                                                    ),
+                                                    html.Ul(
+                                                        [
+                                                            html.Li(
+                                                                "OSI is the normalised score between 0 and 1, which"
+                                                                " is equal to the difference of the "
+                                                                "actual total score and the lowest total score divided by "
+                                                                "the range of total score values for all countries. "
+                                                            ),
+                                                            html.Li(
+                                                                [
+                                                                    "Each country’s TII is the arithmetic average of",
+                                                                    html.Ul(
+                                                                        [
+                                                                            html.Li(
+                                                                                "Estimated internet users "
+                                                                                "per 100 inhabitants;",
+                                                                            ),
+                                                                            html.Li(
+                                                                                "Number of mobile subscribers "
+                                                                                "per 100 inhabitants;"
+                                                                            ),
+                                                                            html.Li(
+                                                                                "Active mobile broadband subscriptions"
+                                                                                "per 100 inhabitants;"
+                                                                            ),
+                                                                            html.Li(
+                                                                                "Number of fixed broadband subscriptions "
+                                                                                "per 100 inhabitants"
+                                                                            )
+                                                                        ]
+                                                                    )
+                                                                ]
+                                                            ),
+                                                            html.Li(
+                                                                [
+                                                                    "Each country’s HCI is calculated using:",
+                                                                    html.Ul(
+                                                                        [
+                                                                            html.Li(
+                                                                                "The adult literacy rate;",
+                                                                            ),
+                                                                            html.Li(
+                                                                                "The combined primary, secondary and "
+                                                                                "tertiary gross enrolment ratio;"
+                                                                            ),
+                                                                            html.Li(
+                                                                                "Expected years of schooling;"
+                                                                            ),
+                                                                            html.Li(
+                                                                                "Average years of schooling."
+                                                                            )
+                                                                        ]
+                                                                    )
+                                                                ]
+                                                            )
+                                                        ]
+                                                    ),
+                                                    html.P(
+                                                        [
+                                                            "More information about the methodology can be found in ",
+                                                            html.A(
+                                                                "documents published directly by the UN",
+                                                                href="https://www.un.org/development/desa/"
+                                                                     "publications/publication/"
+                                                                     "2020-united-nations-e-government-survey",
+                                                                target="_blank",
+                                                            ),
+                                                            "."
+                                                        ]
+                                                    )
+                                                ]
+                                            )
+                                        ],
+                                        id="un_description",
+                                        className="pretty_container description twelve columns flex-display"
+                                    ),
+                                ],
+                                className="content_holder row twelve columns flex-display"
+                            ),
+                            html.Div(
+                                [
+                                    map_panel(INDICES['un'], snapshot.datasets['un']),
+                                    ranking_panel(INDICES['un'], snapshot.datasets['un'], paged)
+                                ],
+                                className="content_holder row twelve columns flex-display"
+                            ),
+                        ],
+                        className="pretty_container_bg twelve columns",
+                    ),
+                ],
+                className="row flex-display",
+            ),
+
+            html.Div(
+                [
+                    html.Div(
+                        [
+                            html.Div(
+                                [
+                                    html.Div(
+                                        children=[
+                                            html.Img(
+                                                src="https://ec.europa.eu/info/sites/info/themes/europa/images/svg/logo/"
+                                                    "logo--en.svg",
+                                                draggable='False',
+                                                id="logo_eu",
+                                                height='auto',
+                                                width=300,
+                                            ),
+                                            html.Div(
+                                                [
+                                                    html.H3("EU eGovernment index"),
+                                                    html.P(
+                                                        "The e-Government Benchmark is being published by "
+                                                        "the European Union. It is based on a quantitative analysis "
+                                                        "of a set of eight so-called life events. Each life event "
+                                                        "consists of a user journey representing common public services "
+                                                        "that citizens or businesses will go through. Half of the index "
+                                                        "consisting of four life events is measured each year, "
+                                                        "with the life events alternating as seen in the following table."
+                                                        "The final "
+                                                        "index value for each country is calculated as a simple average "
+                                                        "value of the two latest surveys."
+                                                    ),
+                                                    html.Table(
+                                                        [
+
+                                                            html.Tr(
+                                                                [
+                                                                    html.Th(
+                                                                        ""
+                                                                    ),
+                                                                    html.Th(
+                                                                        [
+                                                                            html.P(
+                                                                                "Years"
+                                                                            ),
+                                                                            html.P(
+                                                                                "2012, 2014, 2016, 2018"
+                                                                            ),
+                                                                        ]
+                                                                    ),
+                                                                    html.Th(
+                                                                        [
+                                                                            html.P(
+                                                                                "Years"
+                                                                            ),
+                                                                            html.P(
+                                                                                "2013, 2015, 2017, 2019"
+                                                                            ),
+                                                                        ]
+                                                                    )
+                                                                ]
+                                                            ),
+                                                            html.Tr(
+                                                                [
+                                                                    html.Td(
+                                                                        html.B(
+                                                                            [
+                                                                                "Events in",
+                                                                                html.Br(),
+                                                                                "industry"
+                                                                            ]
                                                                         )
-                                                                    ]
-                                                                )
-                                                            ]
-                                                        ),
-                                                        html.Li(
-                                                            [
-                                                                "Each country’s HCI is calculated using:",
-                                                                html.Ul(
-                                                                    [
-                                                                        html.Li(
-                                                                            "The adult literacy rate;",
-                                                                        ),
-                                                                        html.Li(
-                                                                            "The combined primary, secondary and "
-                                                                            "tertiary gross enrolment ratio;"
-                                                                        ),
-                                                                        html.Li(
-                                                                            "Expected years of schooling;"
-                                                                        ),
-                                                                        html.Li(
-                                                                            "Average years of schooling."
+                                                                    ),
+                                                                    html.Td(
+                                                                        "Business start-up"
+                                                                    ),
+                                                                    html.Td(
+                                                                        "Regular business operations"
+                                                                    )
+                                                                ]
+                                                            ),
+                                                            html.Tr(
+                                                                [
+                                                                    html.Td(
+                                                                        html.B(
+                                                                            [
+                                                                                "Events for",
+                                                                                html.Br(),
+                                                                                "citizens"
+                                                                            ]
                                                                         )
-                                                                    ]
-                                                                )
-                                                            ]
-                                                        )
-                                                    ]
-                                                ),
-                                                html.P(
-                                                    [
-                                                        "More information about the methodology can be found in ",
-                                                        html.A(
-                                                            "documents published directly by the UN",
-                                                            href="https://www.un.org/development/desa/"
-                                                                 "publications/publication/"
-                                                                 "2020-united-nations-e-government-survey",
-                                                            target="_blank",
-                                                        ),
-                                                        "."
-                                                    ]
-                                                )
-                                            ]
-                                        )
-                                    ],
-                                    id="un_description",
-                                    className="pretty_container description twelve columns flex-display"
-                                ),
-                            ],
-                            className="content_holder row twelve columns flex-display"
-                        ),
-                        html.Div(
-                            [
-                                html.Div(
-                                    children=[
-                                        html.Label(
-                                            html.H6('Choose year for visualisation')
-                                        ),
-                                        dcc.Slider(
-                                            id='year-slider',
-                                            min=df['Year'].min(),
-                                            max=df['Year'].max(),
-                                            value=df['Year'].max(),
-                                            marks={
-                                                str(year): 'Year {}'.format(year) if year == df['Year'].min() else str(
-                                                    year)
-                                                for year
-                                                in
-                                                df['Year'].unique()},
-                                            step=None,
-                                            className='slider'
-                                        ),
-
-                                        dcc.Graph(id='world-map-with-slider',
-                                                  figure=generate_world_map(df, df['Year'].max())),
-
-                                    ],
-                                    className="pretty_container ten columns",
-                                ),
-
-                                html.Div(
-                                    [
-                                        # html.Div(
-                                        #     [
-                                        #         html.Div(
-                                        #             [html.H6(str(int(filtered_df.loc[filtered_df['Země'] == 'Česká republika']['Pořadí']))+". místo", id="un_rank_value"),
-                                        #              html.P("Rank of Czechia", id="un_rank_text")],
-                                        #             id="un_rank",
-                                        #             className="mini_container",
-                                        #         ),
-                                        #         html.Div(
-                                        #             [html.H6(str(np.round(float(filtered_df.loc[filtered_df['Země'] == 'Česká republika']['index eGov OSN']),3))+"", id="un_score_value"),
-                                        #              html.P("Score of Czechia", id="un_score_text")],
-                                        #             id="un_score",
-                                        #             className="mini_container",
-                                        #         ),
-                                        #         html.Div(
-                                        #             [html.H6(filtered_df.loc[filtered_df['Země'] == 'Česká republika']['Percentil']+"", id="un_percentile_value"),
-                                        #              html.P("Percentile of Czechia", id="un_percentile_text")],
-                                        #             id="un_percentile",
-                                        #             className="mini_container",
-                                        #         ),
-                                        #     ],
-                                        #     className="twelve flex-display",
-                                        # ),
-                                        html.Div(
-                                            children=[
-                                                html.H4(
-                                                    id='top-un-title',
-                                                    children='TOP 15 countries in ' + str(df['Year'].max())),
-                                                html.Div(
-                                                    id='top-un-table',
-                                                    children=[
-                                                        generate_table(filtered_df, 15)
-                                                    ], style={'columnCount': 1}),
-                                                html.Div(
-                                                    children=[
-                                                        file_download_link(DATA_UN)
-                                                    ]
-                                                )
-                                            ],
-                                            className="pretty_container",
-                                        ),
-                                    ],
-                                    className="three columns right-column",
-                                )
-                            ],
-                            className="content_holder row twelve columns flex-display"
-                        ),
-                    ],
-                    className="pretty_container_bg twelve columns",
-                ),
-            ],
-            className="row flex-display",
-        ),
-
-        html.Div(
-            [
-                html.Div(
-                    [
-                        html.Div(
-                            [
-                                html.Div(
-                                    children=[
-                                        html.Img(
-                                            src="https://ec.europa.eu/info/sites/info/themes/europa/images/svg/logo/"
-                                                "logo--en.svg",
-                                            draggable='False',
-                                            id="logo_eu",
-                                            height='auto',
-                                            width=300,
-                                        ),
-                                        html.Div(
-                                            [
-                                                html.H3("EU eGovernment index"),
-                                                html.P(
-                                                    "The e-Government Benchmark is being published by "
-                                                    "the European Union. It is based on a quantitative analysis "
-                                                    "of a set of eight so-called life events. Each life event "
-                                                    "consists of a user journey representing common public services "
-                                                    "that citizens or businesses will go through. Half of the index "
-                                                    "consisting of four life events is measured each year, "
-                                                    "with the life events alternating as seen in the following table."
-                                                    "The final "
-                                                    "index value for each country is calculated as a simple average "
-                                                    "value of the two latest surveys."
-                                                ),
-                                                html.Table(
-                                                    [
-
-                                                        html.Tr(
-                                                            [
-                                                                html.Th(
-                                                                    ""
-                                                                ),
-                                                                html.Th(
-                                                                    [
-                                                                        html.P(
-                                                                            "Years"
-                                                                        ),
-                                                                        html.P(
-                                                                            "2012, 2014, 2016, 2018"
-                                                                        ),
-                                                                    ]
-                                                                ),
-                                                                html.Th(
-                                                                    [
-                                                                        html.P(
-                                                                            "Years"
-                                                                        ),
-                                                                        html.P(
-                                                                            "2013, 2015, 2017, 2019"
-                                                                        ),
-                                                                    ]
-                                                                )
-                                                            ]
-                                                        ),
-                                                        html.Tr(
-                                                            [
-                                                                html.Td(
-                                                                    html.B(
+                                                                    ),
+                                                                    html.Td(
                                                                         [
-                                                                            "Events in",
+                                                                            "Losing and finding a job",
+                                                                            html.Br(),
+                                                                            "Studying",
                                                                             html.Br(),
-                                                                            "industry"
+                                                                            "Family life (since 2016)"
                                                                         ]
-                                                                    )
-                                                                ),
-                                                                html.Td(
-                                                                    "Business start-up"
-                                                                ),
-                                                                html.Td(
-                                                                    "Regular business operations"
-                                                                )
-                                                            ]
-                                                        ),
-                                                        html.Tr(
-                                                            [
-                                                                html.Td(
-                                                                    html.B(
+                                                                    ),
+                                                                    html.Td(
                                                                         [
-                                                                            "Events for",
+                                                                            "Starting a small claims procedure ",
+                                                                            html.Br(),
+                                                                            "Moving to a different place",
                                                                             html.Br(),
-                                                                            "citizens"
+                                                                            "Ownership and maintenance of a vehicle"
                                                                         ]
                                                                     )
-                                                                ),
-                                                                html.Td(
-                                                                    [
-                                                                        "Losing and finding a job",
-                                                                        html.Br(),
-                                                                        "Studying",
-                                                                        html.Br(),
-                                                                        "Family life (since 2016)"
-                                                                    ]
-                                                                ),
-                                                                html.Td(
-                                                                    [
-                                                                        "Starting a small claims procedure ",
-                                                                        html.Br(),
-                                                                        "Moving to a different place",
-                                                                        html.Br(),
-                                                                        "Ownership and maintenance of a vehicle"
-                                                                    ]
-                                                                )
-                                                            ]
-                                                        )
-                                                    ]
-                                                ),
-                                                html.P(
-                                                    "Furthermore, there are other indicators that are also measured "
-                                                    "in the publications, such as the online availability of general "
-                                                    "public services. These metrics are omitted from this dashboard "
-                                                    "for simplicity as they are not directly comparable with the UN "
-                                                    "benchmark. "
-                                                ),
-                                                html.P(
-                                                    [
-                                                        "More information about the methodology can be found in ",
-                                                        html.A(
-                                                            "documents published directly by the EU",
-                                                            href="https://digital-strategy.ec.europa.eu/en/library/"
-                                                                 "egovernment-benchmark-2020-egovernment-works-people",
-                                                            target="_blank",
-                                                        ),
-                                                        "."
-                                                    ]
-                                                )
-                                            ]
-                                        )
-                                    ],
-                                    id="eu_description",
-                                    className="pretty_container description twelve columns flex-display"
-                                ),
-                            ],
-                            className="content_holder row twelve columns flex-display"
-                        ),
-                        html.Div(
-                            [
-                                html.Div(
-                                    children=[
-                                        html.Label(
-                                            html.H6('Choose year for visualisation')
-                                        ),
-                                        dcc.Slider(
-                                            id='year-slider-2',
-                                            min=dfeu['Year'].min(),
-                                            max=dfeu['Year'].max(),
-                                            value=dfeu['Year'].max(),
-                                            marks={
-                                                str(year): 'Year {}'.format(year) if year == df['Year'].min() else str(
-                                                    year) for year in
-                                                dfeu['Year'].unique()},
-                                            step=None,
-                                            className='slider'
-                                        ),
-
-                                        dcc.Graph(id='europe-map-with-slider',
-                                                  figure=generate_europe_map(dfeu, dfeu['Year'].max(), )),
-
-                                    ],
-                                    className="pretty_container ten columns",
-                                ),
-                                html.Div(
-                                    [
-                                        # html.Div(
-                                        #     [
-                                        #         html.Div(
-                                        #             [html.H6(str(int(filtered_df_eu.loc[filtered_df_eu['Země'] == 'Česká republika']['Pořadí']))+". místo", id="eu_rank_value"),
-                                        #              html.P("Rank of Czechia", id="eu_rank_text")],
-                                        #             id="eu_rank",
-                                        #             className="mini_container",
-                                        #         ),
-                                        #         html.Div(
-                                        #             [html.H6(str(np.round(float(filtered_df_eu.loc[filtered_df_eu['Země'] == 'Česká republika']['index eGov EU']),2)), id="eu_score_value"),
-                                        #              html.P("Score of Czechia", id="eu_score_text")],
-                                        #             id="eu_score",
-                                        #             className="mini_container",
-                                        #         ),
-                                        #         html.Div(
-                                        #             [html.H6(filtered_df_eu.loc[filtered_df_eu['Země'] == 'Česká republika']['Percentil']+"", id="eu_percentile_value"),
-                                        #              html.P("Percentile of Czechia", id="eu_percentile_text")],
-                                        #             id="eu_percentile",
-                                        #             className="mini_container",
-                                        #         ),
-                                        #     ],
-                                        #     className="twelve flex-display",
-                                        # ),
-                                        html.Div(
-                                            children=[
-                                                html.H4(
-                                                    id='top-eu-title',
-                                                    children='TOP 15 countries in ' + str(dfeu['Year'].max())),
-                                                html.Div(
-                                                    id='top-eu-table',
-                                                    children=[
-                                                        generate_table(filtered_df, 15)
-                                                    ], style={'columnCount': 1}),
-                                                html.Div(
-                                                    children=[
-                                                        file_download_link(DATA_EU)
-                                                    ]
-                                                )
-                                            ],
-                                            className="pretty_container",
-                                        ),
-                                    ],
-                                    className="three columns right-column",
-                                ),
-                            ],
-                            className="content_holder row twelve columns flex-display"
-                        ),
-                    ],
-                    className="pretty_container_bg twelve columns",
-                ),
-            ],
-            className="row flex-display",
-        ),
-
-    ],
-    id="mainContainer",
-    style={'columnCount': 1, "display": "flex", "flex-direction": "column"},
-)
+                                                                ]
+                                                            )
+                                                        ]
+                                                    ),
+                                                    html.P(
+                                                        "Furthermore, there are other indicators that are also measured "
+                                                        "in the publications, such as the online availability of general "
+                                                        "public services. These metrics are omitted from this dashboard "
+                                                        "for simplicity as they are not directly comparable with the UN "
+                                                        "benchmark. "
+                                                    ),
+                                                    html.P(
+                                                        [
+                                                            "More information about the methodology can be found in ",
+                                                            html.A(
+                                                                "documents published directly by the EU",
+                                                                href="https://digital-strategy.ec.europa.eu/en/library/"
+                                                                     "egovernment-benchmark-2020-egovernment-works-people",
+                                                                target="_blank",
+                                                            ),
+                                                            "."
+                                                        ]
+                                                    )
+                                                ]
+                                            )
+                                        ],
+                                        id="eu_description",
+                                        className="pretty_container description twelve columns flex-display"
+                                    ),
+                                ],
+                                className="content_holder row twelve columns flex-display"
+                            ),
+                            html.Div(
+                                [
+                                    map_panel(INDICES['eu'], snapshot.datasets['eu']),
+                                    ranking_panel(INDICES['eu'], snapshot.datasets['eu'], paged),
+                                ],
+                                className="content_holder row twelve columns flex-display"
+                            ),
+                        ],
+                        className="pretty_container_bg twelve columns",
+                    ),
+                ],
+                className="row flex-display",
+            ),
+        ] + [correlation_section(snapshot.correlations) if snapshot.correlations.years else correlation_placeholder()],
+        id="mainContainer",
+        style={'columnCount': 1, "display": "flex", "flex-direction": "column"},
+    )
+
+
+# The layout is built once per data snapshot and served from the cache for every later page load
+snapshot_layout = functools.lru_cache(maxsize=1)(build_layout)
+
+
+def serve_layout():
+    """Layout of the live data snapshot."""
+    return snapshot_layout(reloader.current)
+
+
+if LAZY_START:
+    # Built on the first request instead of at import
+    app.config.suppress_callback_exceptions = True
+app.layout = serve_layout
 
 app.title = 'eGovernment benchmark'
 
 
-@app.callback(
-    [Output('world-map-with-slider', 'figure'),
-     Output('top-un-title', 'children'),
-     Output('top-un-table', 'children')
-     # Output('un_rank_value', 'children'),
-     # Output('un_score_value', 'children'),
-     # Output('un_percentile_value', 'children')
-     ],
-    [Input('year-slider', 'value')])
-def update_world_map(selected_year):
-    filtered_df_update = pd.DataFrame(df[df.Year == selected_year], columns=['English name', 'UN eGov index'])
-    filtered_df_update['Rank'] = filtered_df_update['UN eGov index'].rank(method='min', ascending=False)
-    filtered_df_update['Percentile'] = filtered_df_update['UN eGov index'].rank(pct=True)
-    filtered_df_update['Percentile'] = (filtered_df_update['Percentile'] * 100).round(1).astype(str) + '%'
-    filtered_df_update = filtered_df_update[['Rank', 'English name', 'UN eGov index', 'Percentile']]
-    filtered_df_update = filtered_df_update.rename(
-        columns={'English name': 'Country', 'UN eGov index': 'UN index value'})
-    filtered_df_update = filtered_df_update.sort_values('UN index value', ascending=False)
-    return generate_world_map(df, selected_year), \
-           'TOP 15 countries in ' + str(selected_year), \
-           generate_table(filtered_df_update, 15), \
-        # str(int(filtered_df.loc[filtered_df['Země'] == 'Česká republika']['Pořadí']))+". místo", \
-    # str(np.round(float(filtered_df.loc[filtered_df['Země'] == 'Česká republika']['index eGov OSN']),3))+"", \
-    # filtered_df.loc[filtered_df['Země'] == 'Česká republika']['Percentil']
-
-
-@app.callback(
-    [Output('europe-map-with-slider', 'figure'),
-     Output('top-eu-title', 'children'),
-     Output('top-eu-table', 'children')
-     # Output('eu_rank_value', 'children'),
-     # Output('eu_score_value', 'children'),
-     # Output('eu_percentile_value', 'children')
-     ],
-    [Input('year-slider-2', 'value')])
-def update_europe_map(selected_year):
-    filtered_df_eu_update = pd.DataFrame(dfeu[dfeu.Year == selected_year], columns=['English name', 'EU eGov index'])
-    filtered_df_eu_update['Rank'] = filtered_df_eu_update['EU eGov index'].rank(method='min', ascending=False)
-    filtered_df_eu_update['Percentile'] = filtered_df_eu_update['EU eGov index'].rank(pct=True)
-    filtered_df_eu_update['Percentile'] = (filtered_df_eu_update['Percentile'] * 100).round(1).astype(str) + '%'
-    filtered_df_eu_update = filtered_df_eu_update[['Rank', 'English name', 'EU eGov index', 'Percentile']]
-    filtered_df_eu_update = filtered_df_eu_update.rename(
-        columns={'English name': 'Country', 'EU eGov index': 'EU index value'})
-    filtered_df_eu_update = filtered_df_eu_update.sort_values('EU index value', ascending=False)
-    return generate_europe_map(dfeu, selected_year), \
-           'TOP 15 countries in ' + str(selected_year), \
-           generate_table(filtered_df_eu_update, 15), \
-        # str(int(filtered_df_eu.loc[filtered_df_eu['Země'] == 'Česká republika']['Pořadí'])) + ". místo", \
-    # str(np.round(float(filtered_df_eu.loc[filtered_df_eu['Země'] == 'Česká republika']['index eGov EU']), 2)), \
-    # filtered_df_eu.loc[filtered_df_eu['Země'] == 'Česká republika']['Percentil']
+def map_outputs(index):
+    """Outputs of a map callback.
+
+    By default the callback sends the map update that the browser merges into the figure, with FULL_FIGURES
+    the whole figure, and in the CLIENTSIDE_MAPS mode the figure is left to the clientside callback.
+    In the ANIMATED_MAPS mode the figure holds all years and the slider only selects the ranking.
+    """
+    outputs = [Output(index.title_id, 'children'), Output(index.table_id, 'children')]
+    if CLIENTSIDE_MAPS or ANIMATED_MAPS:
+        return outputs
+    if FULL_FIGURES:
+        return [Output(index.graph_id, 'figure')] + outputs
+    return [Output(index.update_id, 'data')] + outputs
+
+
+def map_response(figure, *outputs):
+    """Return value of a map callback matching map_outputs, the figure or its update is only built when it is sent."""
+    return outputs if CLIENTSIDE_MAPS or ANIMATED_MAPS else (figure(),) + outputs
+
+
+def register_map(index):
+    """Updates the map, title and ranking table of the index for the year selected on its slider."""
+    @app.callback(map_outputs(index), [Input(index.slider_id, 'value')])
+    def update_map(selected_year):
+        data = reloader.current.datasets[index.key]
+        figure = functools.partial(cached_map if FULL_FIGURES else cached_year_update, index, data, selected_year)
+        # In the paged mode the table keeps its component and only its page data is updated
+        if PAGED_TABLES:
+            return map_response(figure, 'Ranking of countries in ' + str(selected_year), dash.no_update)
+        return map_response(figure, 'TOP 15 countries in ' + str(selected_year), ranking_table(index, data, selected_year))
+
+    if ANIMATED_MAPS:
+        # The figure switches between its frames by itself
+        return update_map
+    if CLIENTSIDE_MAPS:
+        # The figure is swapped in the browser by assets/clientside.js, see generate_year_arrays
+        app.clientside_callback(
+            ClientsideFunction('maps', 'update_year'),
+            Output(index.graph_id, 'figure'),
+            [Input(index.slider_id, 'value')],
+            [State(index.store_id, 'data'), State(index.graph_id, 'figure')])
+    elif not FULL_FIGURES:
+        # Merges the update sent by the server into the figure already in the browser
+        app.clientside_callback(
+            ClientsideFunction('maps', 'apply_update'),
+            Output(index.graph_id, 'figure'),
+            [Input(index.update_id, 'data')],
+            [State(index.graph_id, 'figure')])
+    return update_map
+
+
+def register_paged_table(index):
+    """Serves the pages of the paged ranking table of the index for the year selected on its slider."""
+    @app.callback(
+        [Output(index.ranking_id, 'data'),
+         Output(index.ranking_id, 'page_count')],
+        [Input(index.slider_id, 'value'),
+         Input(index.ranking_id, 'page_current'),
+         Input(index.ranking_id, 'page_size'),
+         Input(index.ranking_id, 'sort_by')])
+    def update_paged_table(selected_year, page_current, page_size, sort_by):
+        ranking = reloader.current.datasets[index.key].ranking(selected_year)
+        return page_records(ranking, page_current or 0, page_size, sort_by, format_ranking), \
+            max(1, -(-len(ranking) // page_size))
+
+    return update_paged_table
+
+
+# Callbacks of every index, generated from the registry
+map_callbacks = {key: register_map(index) for key, index in INDICES.items()}
+if PAGED_TABLES:
+    for index in INDICES.values():
+        register_paged_table(index)
+update_world_map = map_callbacks['un']
+update_europe_map = map_callbacks['eu']
+# Indices by the output string the browser sends for their map callback
+map_callback_ids = {'..' + '...'.join('{}.{}'.format(output.component_id, output.component_property)
+                                      for output in map_outputs(index)) + '..': index for index in INDICES.values()}
+
+
+def map_response_key():
+    """Response cache key of a map callback request for a year of versioned data, None for any other request."""
+    body = request.get_json(silent=True) or {}
+    index = map_callback_ids.get(body.get('output'))
+    inputs = body.get('inputs') or []
+    if index is None or len(inputs) != 1 or not isinstance(inputs[0], dict):
+        return None
+    data = reloader.current.datasets[index.key]
+    year = inputs[0].get('value')
+    # Only years of the data, so that requests for others cannot push the cached responses out
+    if data.version is None or type(year) is not int or year not in data.years:
+        return None
+    return map_key(index, data), year
+
+
+serve_cached_responses(server, app.config.routes_pathname_prefix + '_dash-update-component', response_cache,
+                       map_response_key)
+
+
+def register_correlation():
+    """Updates the correlation scatter and statistics for the selected year."""
+    @app.callback(
+        [Output('correlation-scatter', 'figure'),
+         Output('correlation-statistics', 'children')],
+        [Input('correlation-year', 'value')])
+    def update_correlation(selected_year):
+        correlations = reloader.current.correlations
+        # A page built from an older snapshot may offer a year the live data no longer has, or none at all
+        if not correlations.years or selected_year not in [POOLED] + correlations.years:
+            return dash.no_update, dash.no_update
+        return cached_correlation_scatter(correlations, selected_year), correlation_statistics(correlations, selected_year)
+
+    return update_correlation
+
+
+# Registered whether or not the correlation file exists yet, a reload may add or remove it
+update_correlation = register_correlation()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,46 @@
+/* Clientside callbacks merging the data of another year into the map figure already in the browser */
+
+/* Copy of the figure with the trace data, colorbar title and title of another year */
+function withYear(figure, update) {
+    var trace = Object.assign({}, figure.data[0], {
+        locations: update.locations,
+        z: update.z,
+        text: update.text,
+        colorbar: Object.assign({}, figure.data[0].colorbar, {title: {text: update.colorbar}})
+    });
+    var layout = Object.assign({}, figure.layout, {
+        title: Object.assign({}, figure.layout.title, {text: update.title})
+    });
+    return {data: [trace], layout: layout};
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    maps: {
+        /* Swaps the trace data of the map for the selected year, using the per-year arrays
+           shipped once in a dcc.Store, so moving the slider needs no server round trip.
+           Used when the app runs with EGOV_CLIENTSIDE_MAPS=1. */
+        update_year: function (year, yearData, figure) {
+            if (!yearData || !figure || !yearData.years[year]) {
+                return window.dash_clientside.no_update;
+            }
+            var selected = yearData.years[year];
+            return withYear(figure, {
+                locations: selected.locations,
+                z: selected.z,
+                text: selected.text.map(function (name) {
+                    return yearData.names[name];
+                }),
+                colorbar: year + ' index value',
+                title: yearData.title + year
+            });
+        },
+        /* Merges the properties of the selected year sent by the map callback into the figure,
+           see generators.generate_year_update. */
+        apply_update: function (update, figure) {
+            if (!update || !figure) {
+                return window.dash_clientside.no_update;
+            }
+            return withYear(figure, update);
+        }
+    }
+});
@@ -0,0 +1,139 @@
+"""Micro-benchmarks of the data loading, ranking, figure, table and callback code paths.
+
+    $ python benchmarks.py [--scale 1 10 100] [--repeat 5] [--output results.json] [--check]
+
+Every benchmark runs on the datasets the app is configured with (scale 1) and on synthetic versions
+with the countries repeated scale times, see synthetic.replicate. Results are printed as JSON,
+--check compares the median times against benchmark-thresholds.json and exits with an error when
+one of them is exceeded.
+"""
+import argparse
+import contextlib
+import json
+import os
+import statistics
+import sys
+import time
+
+from synthetic import replicate
+
+THRESHOLDS = 'benchmark-thresholds.json'
+
+
+def measure(function, repeat, setup=None):
+    """Runs the function repeat times and returns its timings in seconds, calling setup untimed before every run."""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return {'median': statistics.median(timings), 'min': min(timings), 'max': max(timings), 'runs': repeat}
+
+
+@contextlib.contextmanager
+def using_datasets(app, **datasets):
+    """Points the app callbacks at the given datasets, by index key, for the duration of the block."""
+    original = app.reloader.current
+    app.reloader.current = original.replace(datasets=dict(original.datasets, **datasets))
+    clear_caches(app)
+    try:
+        yield
+    finally:
+        app.reloader.current = original
+        clear_caches(app)
+
+
+def clear_caches(app):
+    """Drops the figures, tables and map updates the callbacks cache, so the next call builds them."""
+    app.figure_cache.invalidate()
+    app.table_cache.invalidate()
+    app.update_cache.invalidate()
+
+
+def callback_outputs(key):
+    """outputs_list argument Dash passes to the map callback of an index, matching app.map_outputs."""
+    app = app_module()
+    return [{'id': output.component_id, 'property': output.component_property}
+            for output in app.map_outputs(app.INDICES[key])]
+
+
+def app_module():
+    import app
+    return app
+
+
+def run(scales=(1,), repeat=5):
+    """Runs all benchmarks at the given scales and returns their results keyed by name and scale."""
+    app = app_module()
+    # Timings are only taken once the background warm-up no longer competes for the CPU
+    if app.warmup is not None:
+        app.warmup.wait()
+    from dataset import Dataset
+    from generators import generate_world_map, generate_europe_map, generate_table
+
+    results = {}
+    world_outputs = callback_outputs('un')
+    europe_outputs = callback_outputs('eu')
+    for scale in scales:
+        datasets = app.reloader.current.datasets
+        un_frame = replicate(datasets['un'].frame[datasets['un'].columns], scale)
+        eu_frame = replicate(datasets['eu'].frame[datasets['eu'].columns], scale)
+        un_data = Dataset(un_frame, app.DATA_UN, datasets['un'].value_column)
+        eu_data = Dataset(eu_frame, app.DATA_EU, datasets['eu'].value_column)
+        un_year, eu_year = un_data.years[-1], eu_data.years[-1]
+        benchmarks = {
+            'load_csv': lambda: Dataset.from_csv(os.path.join(app.DATA_DIR, app.DATA_UN), app.DATA_UN, 'UN eGov index'),
+            'rank_pipeline': lambda: Dataset(un_frame, app.DATA_UN, 'UN eGov index'),
+            'generate_world_map': lambda: generate_world_map(un_data, un_year),
+            'generate_europe_map': lambda: generate_europe_map(eu_data, eu_year),
+            'generate_table': lambda: generate_table(app.format_ranking(un_data.ranking(un_year).iloc[:15]), 15),
+        }
+        callbacks = {
+            'update_world_map': lambda: app.update_world_map(un_year, outputs_list=world_outputs),
+            'update_europe_map': lambda: app.update_europe_map(eu_year, outputs_list=europe_outputs),
+        }
+        if scale != 1:
+            # Loading only depends on the files on disk, which are not scaled
+            del benchmarks['load_csv']
+        with using_datasets(app, un=un_data, eu=eu_data):
+            for name, function in benchmarks.items():
+                results['{}@{}'.format(name, scale)] = measure(function, repeat)
+            # Callbacks cold, building their figure and table with the caches cleared before every run,
+            # and warm, answered from the caches
+            for name, function in callbacks.items():
+                results['{}@{}'.format(name, scale)] = measure(function, repeat, lambda: clear_caches(app))
+                function()
+                results['{}_warm@{}'.format(name, scale)] = measure(function, repeat)
+    return results
+
+
+def check(results, thresholds):
+    """Returns the messages of all results whose median exceeds its threshold in seconds."""
+    return [
+        '{}: median {:.4f}s exceeds the {:.4f}s threshold'.format(name, results[name]['median'], limit)
+        for name, limit in sorted(thresholds.items())
+        if name in results and results[name]['median'] > limit
+    ]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--scale', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--output', help='also write the results to this file')
+    parser.add_argument('--check', action='store_true', help='fail when a threshold is exceeded')
+    args = parser.parse_args()
+
+    results = run(args.scale, args.repeat)
+    print(json.dumps(results, indent=2, sort_keys=True))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
+    if args.check:
+        with open(THRESHOLDS) as thresholds:
+            failures = check(results, json.load(thresholds))
+        for failure in failures:
+            print(failure, file=sys.stderr)
+        sys.exit(1 if failures else 0)
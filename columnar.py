@@ -0,0 +1,107 @@
+"""Typed columnar binary copies of the csv datasets, loaded without parsing the csv.
+
+Every column is stored as its own .npy file next to a meta.json describing it: text columns as
+categorical codes with their categories, integer columns in the narrowest fitting integer type
+and float columns as float32 with the number of decimals needed to restore the csv values (float64
+when float32 cannot hold them exactly).
+Build them with
+
+    $ python columnar.py [data/eGov-t5.csv ...]
+
+and the app loads them instead of parsing the csv files, as long as they match their source. The
+arrays are read into memory and copied into the frame, the format only saves the csv parsing.
+"""
+import json
+import pathlib
+import sys
+
+import numpy as np
+import pandas as pd
+
+from snapshot import file_digest
+
+COLUMNAR_DIR = 'columnar'
+FORMAT_VERSION = 2
+
+
+def columnar_path(csv_path):
+    """Directory holding the columnar copy of the given csv file."""
+    csv_path = pathlib.Path(csv_path)
+    return csv_path.parent / COLUMNAR_DIR / csv_path.stem
+
+
+def _source_stamp(csv_path):
+    # By contents rather than mtime, which archives such as the Heroku slug do not keep to the nanosecond
+    return {'size': pathlib.Path(csv_path).stat().st_size, 'sha1': file_digest(str(csv_path))}
+
+
+def _float32_decimals(values, limit=10):
+    """Decimals restoring the values exactly from float32, or None if float32 is too narrow for them."""
+    narrow = values.astype(np.float32).astype(np.float64)
+    for decimals in range(limit + 1):
+        if np.array_equal(np.round(narrow, decimals), values, equal_nan=True):
+            return decimals
+    return None
+
+
+def build(csv_path):
+    """Converts the csv file to the columnar format and returns the directory it was written to."""
+    frame = pd.read_csv(csv_path)
+    directory = columnar_path(csv_path)
+    directory.mkdir(parents=True, exist_ok=True)
+    columns = []
+    for position, name in enumerate(frame.columns):
+        values = frame[name]
+        column = {'name': name, 'file': '{}.npy'.format(position)}
+        if values.dtype.kind == 'O':
+            codes, categories = pd.factorize(values, sort=True)
+            array = codes.astype(np.int16 if len(categories) < np.iinfo(np.int16).max else np.int32)
+            column.update(kind='categorical', categories=categories.tolist())
+        elif values.dtype.kind in 'iu':
+            array = values.to_numpy(dtype=np.min_scalar_type(-max(abs(values.min()), abs(values.max()))))
+            column.update(kind='int')
+        else:
+            decimals = _float32_decimals(values.to_numpy(dtype=np.float64))
+            array = values.to_numpy(dtype=np.float64 if decimals is None else np.float32)
+            column.update(kind='float', decimals=decimals)
+        np.save(str(directory / column['file']), array)
+        columns.append(column)
+    meta = {'version': FORMAT_VERSION, 'source': _source_stamp(csv_path), 'rows': len(frame), 'columns': columns}
+    # meta.json is written last, so a build that was interrupted is never picked up as complete
+    (directory / 'meta.json').write_text(json.dumps(meta))
+    return directory
+
+
+def load(csv_path):
+    """Loads the columnar copy of the csv file, or returns None if it is missing or stale."""
+    directory = columnar_path(csv_path)
+    try:
+        meta = json.loads((directory / 'meta.json').read_text())
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != FORMAT_VERSION or meta.get('source') != _source_stamp(csv_path):
+        return None
+    data = {}
+    for column in meta['columns']:
+        array = np.load(str(directory / column['file']))
+        if column['kind'] == 'categorical':
+            data[column['name']] = pd.Categorical.from_codes(array, column['categories'])
+        elif column['kind'] == 'float' and column['decimals'] is not None:
+            # float32 keeps the file small, rounding restores the exact values of the csv
+            data[column['name']] = np.round(array.astype(np.float64), column['decimals'])
+        else:
+            data[column['name']] = array
+    return pd.DataFrame(data, columns=[column['name'] for column in meta['columns']])
+
+
+def read_frame(csv_path):
+    """Reads a dataset from its columnar copy when it is up to date, falling back to parsing the csv."""
+    frame = load(csv_path)
+    if frame is None:
+        frame = pd.read_csv(csv_path)
+    return frame
+
+
+if __name__ == '__main__':
+    for path in sys.argv[1:] or sorted(pathlib.Path('data').glob('*.csv')):
+        print('Built {}'.format(build(path)))
@@ -0,0 +1,145 @@
+"""Correlation of the UN and EU indices, from the normalised scores in data/correlation-data.csv.
+
+Pearson and Spearman correlations, a least squares fit of the UN score on the EU score and the
+countries whose residual is an outlier, per year and pooled over all years. All groups are computed
+in one vectorized pass and cached by the content of their rows, so when the dataset changes only
+the years whose rows changed are computed again.
+"""
+import hashlib
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+CORRELATION_FILE = os.environ.get('EGOV_DATA_CORRELATION', 'correlation-data.csv')
+X_COLUMN = 'EU normalised'
+Y_COLUMN = 'UN normalised'
+# Year of the statistics pooled over all years
+POOLED = 0
+# Residuals further than this many standard deviations from the fit are reported as outliers
+OUTLIER_SIGMAS = 2.0
+
+
+def correlate(frame, groups):
+    """Statistics of every group of the frame and its points with their fit residuals.
+
+    Returns a frame of count, pearson, spearman, slope and intercept indexed by group, and the
+    Country, Year, x, y, Residual and Outlier columns of the rows.
+    """
+    x, y = frame[X_COLUMN].astype(np.float64), frame[Y_COLUMN].astype(np.float64)
+    # Spearman is the Pearson correlation of the ranks, which are computed within the group
+    ranks = pd.DataFrame({'x': x, 'y': y}).groupby(groups).rank()
+    moments = pd.DataFrame({
+        'x': x, 'y': y,
+        'rank_x': ranks['x'], 'rank_y': ranks['y'],
+    })
+    centered = moments - moments.groupby(groups).transform('mean')
+    sums = pd.DataFrame({
+        'count': 1,
+        'xx': centered['x'] ** 2,
+        'yy': centered['y'] ** 2,
+        'xy': centered['x'] * centered['y'],
+        'rank_xx': centered['rank_x'] ** 2,
+        'rank_yy': centered['rank_y'] ** 2,
+        'rank_xy': centered['rank_x'] * centered['rank_y'],
+    }).groupby(groups).sum()
+    means = moments[['x', 'y']].groupby(groups).mean()
+
+    statistics = pd.DataFrame({
+        'count': sums['count'],
+        'pearson': sums['xy'] / np.sqrt(sums['xx'] * sums['yy']),
+        'spearman': sums['rank_xy'] / np.sqrt(sums['rank_xx'] * sums['rank_yy']),
+        'slope': sums['xy'] / sums['xx'],
+    })
+    statistics['intercept'] = means['y'] - statistics['slope'] * means['x']
+
+    slope = statistics['slope'].reindex(groups).to_numpy()
+    residual = centered['y'].to_numpy() - slope * centered['x'].to_numpy()
+    # Standard error of the fit, with the two degrees of freedom of the line taken off
+    squared = pd.Series(residual ** 2, index=frame.index).groupby(groups).sum()
+    error = np.sqrt(squared / (statistics['count'] - 2)).reindex(groups).to_numpy()
+    points = pd.DataFrame({
+        'Country': frame['Country'].astype(str),
+        'Year': frame['Year'],
+        'x': x,
+        'y': y,
+        'Residual': residual,
+        'Outlier': np.abs(residual) > OUTLIER_SIGMAS * error,
+    }, index=frame.index)
+    return statistics, points
+
+
+def _digest(rows):
+    """Content hash of the rows of one year."""
+    values = pd.util.hash_pandas_object(rows[['Country', X_COLUMN, Y_COLUMN]], index=False).to_numpy()
+    return hashlib.sha1(values.tobytes()).hexdigest()
+
+
+class Correlations(object):
+    """Cached correlation statistics per year and pooled, updated incrementally when the dataset changes.
+
+    Starting from a base instance reuses its results, so a new version of the dataset can be computed
+    next to the one in use, only the years that differ from the base are computed.
+    """
+
+    def __init__(self, base=None):
+        self._lock = threading.Lock()
+        self._digests = dict(base._digests) if base is not None else {}
+        self._statistics = dict(base._statistics) if base is not None else {}
+        self._points = dict(base._points) if base is not None else {}
+        # Years computed by the last update
+        self.computed = []
+
+    def update(self, frame):
+        """Computes the statistics of the years whose rows changed since the last update and returns them."""
+        frame = frame.reset_index(drop=True)
+        parts = {int(year): rows for year, rows in frame.groupby('Year')}
+        digests = {year: _digest(rows) for year, rows in parts.items()}
+        digests[POOLED] = hashlib.sha1(''.join(digests[year] for year in sorted(digests)).encode()).hexdigest()
+
+        with self._lock:
+            changed = sorted(year for year, digest in digests.items() if self._digests.get(year) != digest)
+            changed_years = [year for year in changed if year != POOLED]
+            if changed_years:
+                rows = frame[frame['Year'].isin(changed_years)]
+                groups = rows['Year'].astype(int)
+                self._store(groups, *correlate(rows, groups))
+            if POOLED in changed:
+                groups = pd.Series(POOLED, index=frame.index)
+                self._store(groups, *correlate(frame, groups))
+            # Years no longer in the dataset are dropped
+            for year in set(self._digests) - set(digests):
+                del self._statistics[year], self._points[year]
+            self._digests = digests
+            self.computed = changed
+        return changed
+
+    def _store(self, groups, statistics, points):
+        for group, rows in points.groupby(groups):
+            row = statistics.loc[group]
+            self._statistics[int(group)] = dict({name: float(value) for name, value in row.items()},
+                                                count=int(row['count']), year=int(group))
+            self._points[int(group)] = rows
+
+    @property
+    def years(self):
+        """Years with statistics, without the pooled one."""
+        return sorted(year for year in self._statistics if year != POOLED)
+
+    def digest(self, year=POOLED):
+        """Content hash of the rows of the year, or of all years pooled."""
+        return self._digests[year]
+
+    def statistics(self, year=POOLED):
+        """Count, correlations and fit of the year, or of all years pooled."""
+        return self._statistics[year]
+
+    def points(self, year=POOLED):
+        """Rows of the year, or of all years, with their fit residual and outlier flag."""
+        return self._points[year]
+
+    def outliers(self, year=POOLED):
+        """Countries whose UN score is furthest off the fit on their EU score."""
+        points = self._points[year]
+        return points.loc[points['Outlier'], 'Country'].tolist()
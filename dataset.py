@@ -0,0 +1,228 @@
+import numpy as np
+import pandas as pd
+
+from columnar import read_frame
+
+# Country columns of the datasets, kept once per process in the Countries dimension
+COUNTRY_COLUMNS = ['Code', 'EU-code', 'English name', 'Czech name']
+
+
+def narrow(values):
+    """The values in the narrowest dtype that holds them exactly: text as a categorical, integers in the
+    smallest integer type and floats as float32 when that loses nothing."""
+    if values.dtype.kind == 'O':
+        return values.astype('category')
+    if values.dtype.kind in 'iu' and len(values):
+        return values.astype(np.min_scalar_type(-max(abs(int(values.min())), abs(int(values.max())))))
+    if values.dtype.kind == 'f' and values.dtype.itemsize > 4:
+        narrowed = values.astype(np.float32)
+        if np.array_equal(narrowed.to_numpy(dtype=np.float64), values.to_numpy(), equal_nan=True):
+            return narrowed
+    return values
+
+
+def frame_bytes(frame, categories=None):
+    """Bytes held by the index and columns of the frame.
+
+    The categories of categorical columns are shared between frames, with a dict given they are
+    added to it by identity instead of to the frame, so that each one is counted once.
+    """
+    total = frame.index.memory_usage(deep=True)
+    for _, values in frame.items():
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            total += values.cat.codes.nbytes
+            if categories is None:
+                total += values.cat.categories.memory_usage(deep=True)
+            else:
+                categories[id(values.cat.categories)] = values.cat.categories.memory_usage(deep=True)
+        else:
+            total += values.memory_usage(deep=True, index=False)
+    return total
+
+
+class Countries(object):
+    """Dimension table of the countries of all datasets, one row per code with its other codes and names.
+
+    The country columns of every dataset become categoricals over the categories of this table, so each
+    code and name is held once per process however many years and indices repeat it. Starting from a
+    base instance keeps its categories when they did not change, so datasets that are reused from a
+    previous snapshot keep sharing them.
+    """
+
+    def __init__(self, frames, base=None):
+        frames = list(frames)
+        self.dtypes = {}
+        for column in COUNTRY_COLUMNS:
+            parts = [frame[column] for frame in frames if column in frame]
+            if not parts:
+                continue
+            values = sorted(set().union(*[part.dropna().unique().tolist() for part in parts]))
+            dtype = base.dtypes.get(column) if base is not None else None
+            if dtype is None or dtype.categories.tolist() != values:
+                dtype = pd.CategoricalDtype(values)
+            self.dtypes[column] = dtype
+        columns = list(self.dtypes)
+        rows = pd.concat([frame[[column for column in columns if column in frame]].astype(object) for frame in frames])
+        # First known value of every column per code, as not every dataset has all of them
+        self.table = rows.groupby('Code', sort=True).first()
+        self.table = self.table.astype({column: self.dtypes[column] for column in self.table.columns})
+
+    def __len__(self):
+        return len(self.table)
+
+    def compact(self, frame):
+        """Returns the frame with its country columns over the shared categories and all others narrowed."""
+        return frame.assign(**{
+            column: self.categorical(frame[column]) if column in self.dtypes else narrow(frame[column])
+            for column in frame.columns
+        })
+
+    def categorical(self, values):
+        """The country column as a categorical over the shared categories, values not in them become NaN."""
+        dtype = self.dtypes[values.name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Only the categories are looked up, the missing code -1 stays missing
+            codes = np.append(dtype.categories.get_indexer(values.cat.categories), -1)[values.cat.codes.to_numpy()]
+        else:
+            codes = dtype.categories.get_indexer(values)
+        # Built from codes, as astype keeps categories that are equal but not the shared ones
+        return pd.Series(pd.Categorical.from_codes(codes, dtype=dtype), index=values.index, name=values.name)
+
+    def memory_usage(self, categories=None):
+        """Bytes of the dimension table, see frame_bytes."""
+        return frame_bytes(self.table, categories)
+
+
+class Dataset(object):
+    """Index dataset loaded once and partitioned by Year and Code ahead of time.
+
+    The rows are held once, sorted by year and code. A year is a contiguous slice of them found through
+    its row offsets, a country and a ranking are taken through positions computed at load, so nothing
+    scans the whole table and no second copy of the rows is kept.
+    """
+
+    def __init__(self, frame, name=None, value_column=None, version=None):
+        self.name = name
+        # Content version of the source file, so that what is cached for one version is never served for another
+        self.version = version
+        self.value_column = value_column
+        # Columns of the source data, without the ones derived here
+        self.columns = list(frame.columns)
+        code_keys, codes = pd.factorize(frame['Code'], sort=True)
+        years = frame['Year'].to_numpy()
+        order = np.lexsort((code_keys, years))
+        # Sorted rows under a range index, which takes no memory
+        frame, code_keys, years = frame.iloc[order].reset_index(drop=True), code_keys[order], years[order]
+        if value_column is not None:
+            # Rank and percentile of every country within its year, for all years in one grouped pass
+            by_year = frame.groupby('Year')[value_column]
+            frame = frame.assign(Rank=by_year.rank(method='min', ascending=False).astype(np.float32),
+                                 Percentile=by_year.rank(pct=True))
+        self.frame = frame
+        starts = np.flatnonzero(np.r_[True, years[1:] != years[:-1]]) if len(years) else np.array([], dtype=int)
+        ends = np.r_[starts[1:], len(years)].astype(int)
+        # Slices share the rows of the frame, they are kept so every lookup of a year returns the same frame
+        self._by_year = {int(years[start]): frame.iloc[start:end] for start, end in zip(starts, ends)}
+        self._ranking_order = None
+        if value_column is not None:
+            # Positions of the rows of every year from the best value down, NaN last, within the year's slice
+            values = frame[value_column].to_numpy(dtype=np.float64)
+            self._ranking_order = np.lexsort((-np.nan_to_num(values, nan=-np.inf), years)).astype(np.int32)
+        # Positions of the rows by country and year, a country is a contiguous run of them
+        self._code_order = np.lexsort((years, code_keys)).astype(np.int32)
+        sorted_keys = code_keys[self._code_order]
+        code_starts = np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]]) if len(sorted_keys) else \
+            np.array([], dtype=int)
+        code_ends = np.r_[code_starts[1:], len(sorted_keys)].astype(int)
+        self._code_offsets = dict(zip(codes[sorted_keys[code_starts]].tolist(),
+                                      zip(code_starts.tolist(), code_ends.tolist())))
+        self._year_offsets = dict(zip(self._by_year, zip(starts.tolist(), ends.tolist())))
+        # Row and column of every year and country in the pivot array
+        self._year_positions = {year: position for position, year in enumerate(self._by_year)}
+        self._code_positions = {code: position for position, code in enumerate(self._code_offsets)}
+        self._empty = frame.iloc[0:0]
+        self._pivot = None
+
+    @classmethod
+    def from_csv(cls, path, name=None, value_column=None, version=None):
+        """Loads the dataset from a csv file in the long (one row per country and year) format.
+
+        The columnar copy of the file built by columnar.py is used instead of the csv when it is up to date.
+        """
+        return cls(read_frame(path), name, value_column, version)
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def years(self):
+        """Sorted list of the years present in the dataset."""
+        return list(self._by_year)
+
+    @property
+    def codes(self):
+        """List of the country codes present in the dataset."""
+        return list(self._code_offsets)
+
+    def year(self, year):
+        """Returns the rows of the given year, empty if the year is not in the dataset."""
+        return self._by_year.get(int(year), self._empty)
+
+    def ranking(self, year):
+        """Returns the precomputed Rank, English name, value and Percentile (0-1) of the given year, best first."""
+        if int(year) not in self._year_offsets or self._ranking_order is None:
+            return self._empty
+        start, end = self._year_offsets[int(year)]
+        return self.frame.take(self._ranking_order[start:end])[['Rank', 'English name', self.value_column, 'Percentile']]
+
+    def country(self, code):
+        """Returns the rows of the given country code ordered by year, empty if unknown."""
+        if code not in self._code_offsets:
+            return self._empty
+        start, end = self._code_offsets[code]
+        return self.frame.take(self._code_order[start:end])
+
+    def pivot(self):
+        """Returns the values as a year by country array, NaN where a country has no value in a year.
+
+        Rows follow years and columns follow codes, built on first use.
+        """
+        if self._pivot is None:
+            year_positions = np.repeat(np.arange(len(self._year_offsets)),
+                                       [end - start for start, end in self._year_offsets.values()])
+            code_positions = np.empty(len(self.frame), dtype=np.intp)
+            code_positions[self._code_order] = np.repeat(np.arange(len(self._code_offsets)),
+                                                         [end - start for start, end in self._code_offsets.values()])
+            values = np.full((len(self._by_year), len(self._code_offsets)), np.nan)
+            values[year_positions, code_positions] = self.frame[self.value_column].to_numpy(dtype=np.float64)
+            self._pivot = values
+        return self._pivot
+
+    def memory_usage(self, categories=None):
+        """Bytes held by the frame and each structure derived from it, see frame_bytes.
+
+        The year slices share the rows of the frame and are not counted again.
+        """
+        return {
+            'frame': frame_bytes(self.frame, categories),
+            'rankings': self._ranking_order.nbytes if self._ranking_order is not None else 0,
+            'countries': self._code_order.nbytes,
+            'pivot': self._pivot.nbytes if self._pivot is not None else 0,
+        }
+
+    def values(self, codes, years):
+        """Returns the values of the countries in the given years as a codes by years array, NaN where unknown."""
+        columns = np.array([self._code_positions.get(code, -1) for code in codes], dtype=np.intp)
+        rows = np.array([self._year_positions.get(int(year), -1) for year in years], dtype=np.intp)
+        # Indexing copies, the rows and columns of unknown years and countries are then blanked
+        values = self.pivot()[np.ix_(rows, columns)].T
+        values[columns < 0, :] = np.nan
+        values[:, rows < 0] = np.nan
+        return values
+
+
+def select_year(data, year):
+    """Returns the rows of the given year from a Dataset or a plain dataframe."""
+    if isinstance(data, Dataset):
+        return data.year(year)
+    return data[data.Year == year]
@@ -0,0 +1,121 @@
+import gzip
+import io
+import hashlib
+import importlib
+import importlib.util
+import pathlib
+import threading
+
+import pandas as pd
+
+# Rows written per chunk of a streamed export
+EXPORT_CHUNK_ROWS = 5000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+}
+
+
+class DataFile(object):
+    """A downloadable dataset file, with its gzip variant compressed once per file version."""
+
+    def __init__(self, path):
+        self.path = path
+        self.name = path.name
+        stat = path.stat()
+        self.size = stat.st_size
+        self.mtime = stat.st_mtime
+        self._gzip = None
+        self._lock = threading.Lock()
+
+    def gzip(self):
+        """Returns the gzip compressed file contents and their ETag, compressing on first use."""
+        with self._lock:
+            if self._gzip is None:
+                body = gzip.compress(self.path.read_bytes(), 9)
+                self._gzip = body, hashlib.sha1(body).hexdigest()
+            return self._gzip
+
+
+class DataIndex(object):
+    """Whitelist of the dataset files that can be downloaded, nothing outside of it is ever served."""
+
+    def __init__(self, directory, pattern='*.csv'):
+        self.directory = pathlib.Path(directory)
+        self.pattern = pattern
+        self._files = {}
+        self.refresh()
+
+    def refresh(self):
+        """Rescans the directory, keeping the compressed variants of unchanged files."""
+        files = {}
+        for path in sorted(self.directory.glob(self.pattern)):
+            current = self._files.get(path.name)
+            stat = path.stat()
+            if current is not None and (current.mtime, current.size) == (stat.st_mtime, stat.st_size):
+                files[path.name] = current
+            else:
+                files[path.name] = DataFile(path)
+        self._files = files
+
+    def __contains__(self, name):
+        return name in self._files
+
+    def __getitem__(self, name):
+        return self._files[name]
+
+    def listing(self):
+        """Name, size and modification time of all downloadable files."""
+        return [
+            {'name': data_file.name, 'size': data_file.size, 'modified': int(data_file.mtime)}
+            for data_file in self._files.values()
+        ]
+
+
+def filter_rows(data, years=(), codes=()):
+    """Rows of a Dataset in the given years and country codes, using its partitions instead of a scan."""
+    if years:
+        rows = pd.concat([data.year(year) for year in years])
+        if codes:
+            rows = rows[rows['Code'].isin(codes)]
+    elif codes:
+        rows = pd.concat([data.country(code) for code in codes])
+    else:
+        rows = data.frame
+    return rows[data.columns]
+
+
+def stream_export(rows, export_format):
+    """Yields the rows encoded in the given export format chunk by chunk, never as one response body."""
+    if export_format == 'csv':
+        yield rows.iloc[0:0].to_csv(index=False)
+        for start in range(0, len(rows), EXPORT_CHUNK_ROWS):
+            yield rows.iloc[start:start + EXPORT_CHUNK_ROWS].to_csv(header=False, index=False)
+    elif export_format == 'arrow':
+        # pyarrow is optional and heavy, so it is only imported once an arrow export is requested
+        pyarrow = importlib.import_module('pyarrow')
+        importlib.import_module('pyarrow.ipc')
+        buffer = io.BytesIO()
+        schema = pyarrow.Schema.from_pandas(rows, preserve_index=False)
+        with pyarrow.ipc.new_stream(buffer, schema) as writer:
+            for start in range(0, len(rows), EXPORT_CHUNK_ROWS):
+                chunk = rows.iloc[start:start + EXPORT_CHUNK_ROWS]
+                writer.write_batch(pyarrow.RecordBatch.from_pandas(chunk, schema=schema, preserve_index=False))
+                yield _drain(buffer)
+        yield _drain(buffer)
+    else:
+        raise ValueError('Unknown export format: {}'.format(export_format))
+
+
+def _drain(buffer):
+    """Returns the bytes written to the buffer so far and empties it."""
+    body = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return body
+
+
+def export_formats():
+    """Export formats usable with the installed packages."""
+    return [name for name in EXPORT_FORMATS if name != 'arrow' or importlib.util.find_spec('pyarrow') is not None]
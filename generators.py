@@ -1,40 +1,199 @@
-import dash
-import dash_core_components as dcc
 import dash_html_components as html
+import dash_table
 import plotly.graph_objects as go
-import plotly.express as px
+import plotly
 import pandas as pd
 import numpy as np
+import threading
+import json
+
+from collections import OrderedDict
+
+from dataset import select_year
+from indices import INDICES
+
+
+class FigureCache(object):
+    """Size-bounded LRU cache of map figures keyed by (dataset, year).
+
+    The data only changes on deploy, so a figure built once for a given dataset
+    version and year can be handed out to every later callback as is.
+    With a SharedCache attached, a miss is first looked up there, so that the
+    workers build each figure once between them.
+    """
+
+    def __init__(self, maxsize=64, name='figures'):
+        self.maxsize = maxsize
+        # Bound for the entries built on demand, on top of those reserved for the warm-up
+        self._bound = maxsize
+        self.name = name
+        self.shared = None
+        self.hits = 0
+        self.misses = 0
+        self._figures = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._figures)
+
+    def __contains__(self, key):
+        return key in self._figures
+
+    def get(self, dataset, year, build, shared=False):
+        """Returns the cached figure, building it with build(year) on a miss.
+
+        shared marks keys that include the version of their data, only those are looked up in
+        and added to the shared cache, as the same key then always stands for the same figure.
+        """
+        figure = self.lookup(dataset, year)
+        if figure is not None:
+            return figure
+        key = (dataset, int(year))
+        # Built outside of the lock so a slow build does not block lookups of other years
+        if shared and self.shared is not None:
+            figure = self._shared_get(key, build)
+        else:
+            figure = build(key[1])
+        self.put(dataset, year, figure)
+        return figure
+
+    def lookup(self, dataset, year):
+        """Returns the cached figure or None, counted as a hit or a miss like get."""
+        key = (dataset, int(year))
+        with self._lock:
+            if key in self._figures:
+                self._figures.move_to_end(key)
+                self.hits += 1
+                return self._figures[key]
+            self.misses += 1
+        return None
+
+    def put(self, dataset, year, figure):
+        """Adds an entry built elsewhere, such as a callback response serialized by Dash."""
+        with self._lock:
+            self._figures[(dataset, int(year))] = figure
+            while len(self._figures) > self.maxsize:
+                self._figures.popitem(last=False)
+
+    def _shared_get(self, key, build):
+        # Serialized as the JSON Dash sends, which it accepts back as a plain dict in place of the object
+        shared_key = '{}/{}/{}'.format(self.name, *key)
+        errors = self.shared.errors
+        body = self.shared.get(shared_key)
+        if body is not None:
+            return json.loads(body)
+        figure = build(key[1])
+        # A shared cache that failed on the lookup is not waited on again to store the entry
+        if self.shared.errors == errors:
+            self.shared.put(shared_key, json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder).encode())
+        return figure
+
+    def reserve(self, entries):
+        """Makes room for the given number of entries, such as those the warm-up builds, next to the default bound."""
+        with self._lock:
+            self.maxsize = self._bound + entries
+
+    def warm(self, dataset, years, build, shared=False):
+        """Builds the figures for all given years ahead of the first request."""
+        for year in years:
+            self.get(dataset, year, build, shared)
+
+    def memory_usage(self):
+        """Number of entries and their bytes, measured as their JSON."""
+        with self._lock:
+            figures = list(self._figures.values())
+        return {
+            'entries': len(figures),
+            'bytes': sum(len(json.dumps(figure, cls=plotly.utils.PlotlyJSONEncoder)) for figure in figures),
+        }
+
+    def invalidate(self, dataset=None, years=None):
+        """Drops all cached figures, or only those of the given dataset, optionally only of the given years."""
+        with self._lock:
+            if dataset is None:
+                self._figures.clear()
+            else:
+                for key in [key for key in self._figures
+                            if key[0] == dataset and (years is None or key[1] in years)]:
+                    del self._figures[key]
+
+
+figure_cache = FigureCache()
+# Year under which the animated map of all years is cached next to the maps of single years
+ANIMATED = 0
+# Ranking tables and map updates by the same keys as the maps
+table_cache = FigureCache(name='tables')
+update_cache = FigureCache(name='updates')
+# Serialized and compressed map callback responses by the same keys, see responses.py
+response_cache = FigureCache(name='responses')
+
+
+def _rounded_columns(dataframe):
+    """Returns the columns of the dataframe as lists, with float columns rounded to 2 decimals in one pass."""
+    return [
+        (dataframe[col].round(2) if dataframe[col].dtype.kind == 'f' else dataframe[col]).tolist()
+        for col in dataframe.columns
+    ]
 
 
 def generate_table(dataframe, max_rows=10):
+    rows = zip(*_rounded_columns(dataframe.iloc[:max_rows]))
     return html.Table([
         html.Thead(
             html.Tr([html.Th(col) for col in dataframe.columns])
         ),
         html.Tbody([
-            html.Tr([
-                html.Td(
-                    np.round(dataframe.iloc[i][col], 2)
-                ) if (isinstance(dataframe.iloc[i][col], float)) else (
-                    html.Td(
-                        dataframe.iloc[i][col]
-                    )
-                )
-
-                for col in dataframe.columns
-            ])
-            for i in range(min(len(dataframe), max_rows))
+            html.Tr([html.Td(value) for value in row])
+            for row in rows
         ])
     ])
 
 
-def generate_world_map(df, year):
-    filtered_df = df[df.Year == year]
+def page_records(dataframe, page_current=0, page_size=15, sort_by=None, formatter=None):
+    """Returns the records of one page of the dataframe, sorted as requested by a dash_table sort_by list.
+
+    The optional formatter is applied to the page frame only, so sorting happens on the raw typed columns.
+    """
+    if sort_by:
+        dataframe = dataframe.sort_values(
+            [col['column_id'] for col in sort_by],
+            ascending=[col['direction'] == 'asc' for col in sort_by],
+        )
+    page = dataframe.iloc[page_current * page_size:(page_current + 1) * page_size]
+    if formatter is not None:
+        page = formatter(page)
+    return [dict(zip(page.columns, row)) for row in zip(*_rounded_columns(page))]
+
+
+def generate_paged_table(table_id, dataframe, page_size=15, formatter=None, labels=None):
+    """Server-side paged and sorted table, only the current page is ever sent to the browser.
+
+    Column ids stay the dataframe column names so that sort_by maps straight onto the dataframe,
+    labels optionally gives the displayed column headers.
+    """
+    labels = labels or {}
+    return dash_table.DataTable(
+        id=table_id,
+        columns=[{'name': labels.get(col, col), 'id': col} for col in dataframe.columns],
+        data=page_records(dataframe, 0, page_size, formatter=formatter),
+        page_action='custom',
+        page_current=0,
+        page_size=page_size,
+        page_count=max(1, -(-len(dataframe) // page_size)),
+        sort_action='custom',
+        sort_mode='single',
+        sort_by=[],
+        style_cell={'textAlign': 'left'},
+    )
+
+
+def generate_map(index, df, year):
+    """Choropleth map of the index values in the given year, styled as described by the Index."""
+    filtered_df = select_year(df, year)
 
     fig = go.Figure(data=go.Choropleth(
         locations=filtered_df['Code'],
-        z=filtered_df['UN eGov index'],
+        z=filtered_df[index.value_column],
         text=filtered_df['English name'],
 
         colorscale=[[0.0, "rgb(0,150,50)"],
@@ -42,8 +201,8 @@ def generate_world_map(df, year):
                     [0.6, "rgb(180,60,50)"],
                     [1.0, "rgb(80,20,80)"]],
         # Note - this fixes min and max points on colorscale to make years comparable
-        zmin=0,
-        zmax=1,
+        zmin=index.zmin,
+        zmax=index.zmax,
         autocolorscale=False,
         reversescale=True,
         marker_line_color='darkgray',
@@ -53,12 +212,13 @@ def generate_world_map(df, year):
     ))
 
     fig.update_geos(
-        resolution=50
+        resolution=50,
+        **index.geo
     )
 
     fig.update_layout(
         height=1000,
-        title_text='UN eGovernment index ' + str(year),
+        title_text=index.title + str(year),
         geo=dict(
             showframe=False,
             showcoastlines=False,
@@ -69,15 +229,16 @@ def generate_world_map(df, year):
             y=0.01,
             xref='paper',
             yref='paper',
-            text='Source: <a href="https://publicadministration.un.org/egovkb/">United Nations</a>',
+            text=index.source,
             showarrow=False
-        )]
+        )],
+        **index.layout
     )
 
     # Add logo to figure
     fig.add_layout_image(
         dict(
-            source="assets/logo-icon.png",
+            source="assets/Logo-icon.png",
             xref="paper", yref="paper",
             x=1.08, y=1.0,
             sizex=0.5, sizey=0.1,
@@ -88,66 +249,187 @@ def generate_world_map(df, year):
     return fig
 
 
+def generate_world_map(df, year):
+    return generate_map(INDICES['un'], df, year)
+
+
 def generate_europe_map(df, year):
-    filtered_df = df[df.Year == year]
+    return generate_map(INDICES['eu'], df, year)
 
-    figeu = go.Figure(data=go.Choropleth(
-        locations=filtered_df['Code'],
-        z=filtered_df['EU eGov index'],
-        text=filtered_df['English name'],
 
-        colorscale=[[0.0, "rgb(0,150,50)"],
-                    [0.3, "rgb(250,240,110)"],
-                    [0.6, "rgb(180,60,50)"],
-                    [1.0, "rgb(80,20,80)"]],
-        # Note - this fixes min and max points on colorscale to make years comparable
-        zmin=10,
-        zmax=90,
-        autocolorscale=False,
-        reversescale=True,
-        marker_line_color='darkgray',
-        marker_line_width=0.5,
-        colorbar_tickprefix='',
-        colorbar_title=str(year) + ' index value',
-    ))
+def generate_year_arrays(data, title):
+    """Compact per-year map arrays of a Dataset for swapping the map trace on the client.
 
-    figeu.update_geos(
-        resolution=50,
-        fitbounds="locations",
-        visible=True,
-        scope="europe"
-    )
+    Country names are sent once and referenced by their position, the values are rounded to 4 decimals.
+    """
+    names, name_codes = np.unique(data.frame['English name'].to_numpy(dtype=str), return_inverse=True)
+    name_codes = pd.Series(name_codes, index=data.frame.index)
+    return {
+        'title': title,
+        'names': names.tolist(),
+        'years': {
+            str(year): {
+                'locations': data.year(year)['Code'].tolist(),
+                'z': data.year(year)[data.value_column].round(4).tolist(),
+                'text': name_codes[data.year(year).index].tolist(),
+            }
+            for year in data.years
+        },
+    }
 
-    figeu.update_layout(
-        height=1000,
-        title_text=' EU eGovernment index ' + str(year),
-        geo=dict(
-            showframe=False,
-            showcoastlines=False,
-            projection_type='equirectangular'
-        ),
-        annotations=[dict(
-            x=0.59,
-            y=0.01,
-            xref='paper',
-            yref='paper',
-            text='Source: <a href="https://ec.europa.eu/newsroom/dae/document.cfm?doc_id=62371">\
-                European Union, European Commission</a>',
-            showarrow=False
+
+def generate_year_update(index, data, year):
+    """Trace and layout properties of the map of the index that change between years, see assets/clientside.js.
+
+    The rest of the figure is already in the browser, so a slider move only sends these. Values are rounded to 4 decimals.
+    """
+    rows = select_year(data, year)
+    return {
+        'title': index.title + str(year),
+        'colorbar': str(year) + ' index value',
+        'locations': rows['Code'].tolist(),
+        'z': rows[index.value_column].round(4).tolist(),
+        'text': rows['English name'].tolist(),
+    }
+
+
+def map_key(index, data):
+    """Figure cache key of the maps of the index, including the dataset version when it is known."""
+    version = getattr(data, 'version', None)
+    return index.key if version is None else '{}@{}'.format(index.key, version)
+
+
+def map_entry(index, data):
+    """Cache, key, builder and sharing of the maps of the index, as used by cached_map and the warm-up."""
+    return figure_cache, map_key(index, data), lambda y: generate_map(index, data, y), \
+        getattr(data, 'version', None) is not None
+
+
+def cached_map(index, data, year):
+    """Returns the map of the index for the given year from the figure cache."""
+    cache, key, build, shared = map_entry(index, data)
+    return cache.get(key, year, build, shared)
+
+
+def generate_animated_map(index, data, duration=800):
+    """Map of the index with one Plotly frame per year of the data, played and scrubbed in the browser.
+
+    The figure is the map of the latest year, the frames only carry what changes between years (see
+    generate_year_update), the geo, colorscale and layout are shared by all frames.
+    """
+    fig = generate_map(index, data, data.years[-1])
+    frames = []
+    for year in data.years:
+        update = generate_year_update(index, data, year)
+        frames.append(go.Frame(
+            name=str(year),
+            data=[dict(type='choropleth', locations=update['locations'], z=update['z'], text=update['text'],
+                       colorbar=dict(title=dict(text=update['colorbar'])))],
+            layout=dict(title=dict(text=update['title'])),
+            traces=[0],
+        ))
+    fig.frames = frames
+
+    # Maps cannot transition between frames, each one is drawn again
+    def animate(years, frame_duration):
+        return [years, dict(mode='immediate', frame=dict(duration=frame_duration, redraw=True),
+                            transition=dict(duration=0))]
+
+    fig.update_layout(
+        updatemenus=[dict(
+            type='buttons',
+            direction='left',
+            x=0.0, y=0.0,
+            xanchor='left', yanchor='top',
+            pad=dict(t=40, r=10),
+            showactive=False,
+            buttons=[
+                dict(label='Play', method='animate', args=animate(None, duration)),
+                dict(label='Pause', method='animate', args=animate([None], 0)),
+            ],
+        )],
+        sliders=[dict(
+            active=len(data.years) - 1,
+            x=0.1, y=0.0,
+            len=0.9,
+            pad=dict(t=30),
+            currentvalue=dict(prefix='Year '),
+            steps=[dict(label=str(year), method='animate', args=animate([str(year)], 0)) for year in data.years],
         )],
-        margin={"r": 0, "t": 0, "l": 0, "b": 0},
     )
+    return fig
 
-    # Add logo to figure
-    figeu.add_layout_image(
-        dict(
-            source="assets/logo-icon.png",
-            xref="paper", yref="paper",
-            x=1.08, y=1.0,
-            sizex=0.5, sizey=0.1,
-            xanchor="right", yanchor="bottom"
-        )
+
+def animated_map_entry(index, data):
+    """Cache, key, builder and sharing of the animated map of the index, cached under year ANIMATED of its map key."""
+    return figure_cache, map_key(index, data), lambda y: generate_animated_map(index, data), \
+        getattr(data, 'version', None) is not None
+
+
+def cached_animated_map(index, data):
+    """Returns the animated map of the index from the figure cache."""
+    cache, key, build, shared = animated_map_entry(index, data)
+    return cache.get(key, ANIMATED, build, shared)
+
+
+def generate_correlation_scatter(points, statistics):
+    """Scatter of the normalised EU and UN scores with the least squares fit, residual outliers highlighted."""
+    year = statistics['year']
+    label = 'in ' + str(year) if year else 'over all years'
+    fig = go.Figure()
+    for outlier, name, color in [(False, 'Countries', 'rgb(0,150,50)'), (True, 'Outliers', 'rgb(180,60,50)')]:
+        rows = points[points['Outlier'] == outlier]
+        fig.add_trace(go.Scatter(
+            x=rows['x'].round(4),
+            y=rows['y'].round(4),
+            text=rows['Country'] + ' ' + rows['Year'].astype(str),
+            mode='markers+text' if outlier else 'markers',
+            textposition='top center',
+            name=name,
+            marker=dict(color=color, size=9, line=dict(color='darkgray', width=0.5)),
+        ))
+    ends = np.array([points['x'].min(), points['x'].max()])
+    fig.add_trace(go.Scatter(
+        x=ends.round(4),
+        y=(statistics['intercept'] + statistics['slope'] * ends).round(4),
+        mode='lines',
+        name='Least squares fit',
+        line=dict(color='rgb(80,20,80)', dash='dash'),
+    ))
+    fig.update_layout(
+        height=600,
+        title_text='UN and EU eGovernment index correlation {}: Pearson r = {:.3f}, Spearman ρ = {:.3f}'.format(
+            label, statistics['pearson'], statistics['spearman']),
+        xaxis_title='EU index, normalised',
+        yaxis_title='UN index, normalised',
     )
-    return figeu
+    return fig
+
+
+def year_update_entry(index, data):
+    """Cache, key, builder and sharing of the map updates of the index."""
+    return update_cache, map_key(index, data), lambda y: generate_year_update(index, data, y), \
+        getattr(data, 'version', None) is not None
+
+
+def cached_year_update(index, data, year):
+    """Returns the map update of the index for the given year from the update cache."""
+    cache, key, build, shared = year_update_entry(index, data)
+    return cache.get(key, year, build, shared)
+
+
+def correlation_key(correlations, year):
+    """Figure cache key of the correlation scatter of the year, versioned by the contents of its rows."""
+    return 'correlation@' + correlations.digest(year)[:12]
+
+
+def correlation_entry(correlations, year):
+    """Cache, key, builder and sharing of the correlation scatter of the year, 0 for all years pooled."""
+    return figure_cache, correlation_key(correlations, year), \
+        lambda y: generate_correlation_scatter(correlations.points(y), correlations.statistics(y)), True
 
 
+def cached_correlation_scatter(correlations, year):
+    """Returns the correlation scatter of the given year, 0 for all years pooled, from the figure cache."""
+    cache, key, build, shared = correlation_entry(correlations, year)
+    return cache.get(key, year, build, shared)
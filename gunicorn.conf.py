@@ -0,0 +1,48 @@
+"""Production profile of the gunicorn server, used by the Procfile.
+
+    $ gunicorn --config gunicorn.conf.py app:server
+
+The app is imported once in the master process, which loads the datasets and waits for the warm-up
+of the caches before it forks the workers. The workers share these pages copy-on-write instead of
+each parsing the data and building the figures again. Threads that do not survive a fork are
+started in every worker, see app.after_fork. serverprofile.py measures the memory and startup time
+against the plain setup.
+
+WEB_CONCURRENCY sets the number of workers, the processors of the host by default, and
+EGOV_THREADS the threads of every worker.
+"""
+import gc
+import multiprocessing
+import os
+
+# Read by app.py, which is imported after this file
+os.environ['EGOV_PRELOADED'] = '1'
+
+bind = '0.0.0.0:' + os.environ.get('PORT', '8000')
+preload_app = True
+# The callbacks serialize, compress and sometimes build figures while holding the GIL, so a worker
+# per processor does the work. Its second thread keeps a slow client from holding up the worker, more
+# threads did not add throughput in the load test and only lengthened the tail latency.
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('EGOV_THREADS', '2'))
+# A cold figure build for a data version loaded by a reload can take a few seconds on small instances
+timeout = 60
+keepalive = 5
+
+
+def when_ready(server):
+    """Runs in the master after the app is loaded and before the workers are forked."""
+    import app
+    if app.warmup is not None:
+        app.warmup.wait()
+    # Objects that exist now are left out of the garbage collection of the workers, which would
+    # otherwise write to every one of their pages and end the sharing
+    gc.collect()
+    gc.freeze()
+    server.log.info('Loaded data version %s, forking %s workers', app.reloader.current.version, server.num_workers)
+
+
+def post_fork(server, worker):
+    import app
+    app.after_fork()
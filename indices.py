@@ -0,0 +1,79 @@
+import os
+
+from collections import OrderedDict
+
+# Folder of the dataset files, the environment can point the app at other files such as synthetic.py datasets
+DATA_DIR = os.environ.get('EGOV_DATA_DIR', 'data')
+
+
+class Index(object):
+    """Declarative description of one benchmark index shown on the dashboard.
+
+    Everything that differs between the indices lives here, the loading, ranking, figure, table
+    and callback code is shared and driven by these fields.
+    """
+
+    def __init__(self, key, data_file, value_column, value_label, title, source, zmin, zmax, geo=None,
+                 layout=None, slider_id=None, graph_id=None, store_id=None, title_id=None, table_id=None):
+        self.key = key
+        self.data_file = data_file
+        self.value_column = value_column
+        self.value_label = value_label
+        # Map title, followed by the year
+        self.title = title
+        # Source annotation shown under the map
+        self.source = source
+        # Fixed ends of the colour scale, so that the years are comparable
+        self.zmin = zmin
+        self.zmax = zmax
+        # Extra geo settings of the map, such as its scope
+        self.geo = geo or {}
+        # Extra layout settings of the map
+        self.layout = layout or {}
+        self.slider_id = slider_id or '{}-year-slider'.format(key)
+        self.graph_id = graph_id or '{}-map-with-slider'.format(key)
+        # Year arrays of the map in the CLIENTSIDE_MAPS mode
+        self.store_id = store_id or '{}-map-years'.format(key)
+        # Changed properties of the map sent by the server callback, merged into the figure in the browser
+        self.update_id = '{}-update'.format(self.graph_id)
+        self.title_id = title_id or 'top-{}-title'.format(key)
+        self.table_id = table_id or 'top-{}-table'.format(key)
+        self.ranking_id = '{}-ranking'.format(key)
+
+    @property
+    def path(self):
+        """Path of the dataset file of the index."""
+        return os.path.join(DATA_DIR, self.data_file)
+
+
+INDICES = OrderedDict((index.key, index) for index in [
+    Index(
+        key='un',
+        data_file=os.environ.get('EGOV_DATA_UN', 'eGov-t5.csv'),
+        value_column='UN eGov index',
+        value_label='UN index value',
+        title='UN eGovernment index ',
+        source='Source: <a href="https://publicadministration.un.org/egovkb/">United Nations</a>',
+        zmin=0,
+        zmax=1,
+        slider_id='year-slider',
+        graph_id='world-map-with-slider',
+        store_id='world-map-years',
+    ),
+    Index(
+        key='eu',
+        data_file=os.environ.get('EGOV_DATA_EU', 'eur-t3.csv'),
+        value_column='EU eGov index',
+        value_label='EU index value',
+        title=' EU eGovernment index ',
+        source='Source: <a href="https://ec.europa.eu/newsroom/dae/document.cfm?doc_id=62371">\
+                European Union, European Commission</a>',
+        zmin=10,
+        zmax=90,
+        geo=dict(fitbounds="locations", visible=True, scope="europe"),
+        layout=dict(margin={"r": 0, "t": 0, "l": 0, "b": 0}),
+        slider_id='year-slider-2',
+        graph_id='europe-map-with-slider',
+        store_id='europe-map-years',
+    ),
+])
@@ -0,0 +1,186 @@
+"""Appends a new release of an index to its dataset file, without rewriting the years already in it.
+
+    $ python ingest.py un release.csv [--layout auto|long|wide] [--dry-run]
+
+A release is a csv file in the long layout, one row per country and year with a Code, a Year and the
+value column of the index (or Value), or in the wide layout, one row per country with a Code and a
+column per year such as eGov-t1.csv. It is read row by row, every row is checked against the country
+dimension of the stored datasets and must only hold years that are not in the dataset yet. The names
+and EU28 flag of a country are filled in from its latest stored row unless the release has them.
+
+Only when the whole release is valid are its rows appended, to a copy of the dataset file that then
+replaces it, so the stored years stay byte for byte the same and a reading worker never sees half a
+release. The printed version id is the one the app gives the new file, a worker running with
+EGOV_RELOAD_INTERVAL picks it up by itself, others on their next start.
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import pathlib
+import re
+import shutil
+import sys
+import tempfile
+
+import columnar
+from columnar import read_frame
+from dataset import Countries
+from indices import INDICES
+from snapshot import file_digest
+
+LAYOUTS = ('auto', 'long', 'wide')
+YEAR_COLUMN = re.compile(r'^\d{4}$')
+
+
+class IngestError(ValueError):
+    """A release that cannot be appended, nothing is written then."""
+
+
+def release_rows(path, value_column, layout='auto'):
+    """Yields the rows of the release as dicts of its columns with Code, Year and the value column, reshaping
+    the wide layout on the fly. Values are kept as the text of the release, so they are stored exactly."""
+    with open(path, newline='', encoding='utf-8-sig') as release:
+        reader = csv.reader(release)
+        header = [name.strip() for name in next(reader, [])]
+        years = [name for name in header if YEAR_COLUMN.match(name)]
+        if layout == 'auto':
+            layout = 'long' if 'Year' in header else 'wide'
+        if 'Code' not in header:
+            raise IngestError('{} has no Code column'.format(path))
+        if layout == 'long':
+            value = value_column if value_column in header else 'Value'
+            if 'Year' not in header or value not in header:
+                raise IngestError('{} needs the Code, Year and {} columns of the long layout'.format(path, value_column))
+        elif not years:
+            raise IngestError('{} has no year columns of the wide layout'.format(path))
+
+        for line, values in enumerate(reader, start=2):
+            if not any(values):
+                continue
+            if len(values) != len(header):
+                raise IngestError('line {}: {} values for {} columns'.format(line, len(values), len(header)))
+            row = dict(zip(header, (value.strip() for value in values)))
+            if layout == 'long':
+                row[value_column] = row.pop(value)
+                yield line, row
+            else:
+                fields = {name: text for name, text in row.items() if name not in years}
+                for year in years:
+                    yield line, dict(fields, Year=year, **{value_column: row[year]})
+
+
+def _latest_rows(frames):
+    """Known values of the latest stored row of every country by code, the first frames taking precedence."""
+    latest = {}
+    for frame in reversed(frames):
+        for row in frame.sort_values('Year', kind='mergesort').to_dict('records'):
+            known = {name: value for name, value in row.items() if not _missing(value)}
+            latest[row['Code']] = dict(latest.get(row['Code'], {}), **known)
+    return latest
+
+
+def _missing(value):
+    return value is None or isinstance(value, float) and math.isnan(value)
+
+
+def ingest(index, release, layout='auto', dry_run=False):
+    """Validates the release of the index and appends its rows to the dataset file.
+
+    Returns the years added, the number of rows and the version ids of the file before and after.
+    """
+    if layout not in LAYOUTS:
+        raise IngestError('Unknown layout {}'.format(layout))
+    path = index.path
+    stored = read_frame(path)
+    columns = list(stored.columns)
+    # Codes are checked against the country dimension of all indices, so a country already known to one
+    # index can be added to another
+    frames = [stored] + [read_frame(other.path) for other in INDICES.values() if other.key != index.key]
+    countries = Countries(frames)
+    latest = _latest_rows(frames)
+    stored_years = set(int(year) for year in stored['Year'].unique())
+
+    added = set()
+    count = 0
+    seen = set()
+    with tempfile.TemporaryFile('w+', newline='', encoding='utf-8') as buffer:
+        writer = csv.writer(buffer, lineterminator='\n')
+        for line, row in release_rows(release, index.value_column, layout):
+            code = row['Code'].upper()
+            if code not in countries.table.index:
+                raise IngestError('line {}: unknown country code {!r}'.format(line, row['Code']))
+            try:
+                year = int(row['Year'])
+                value = float(row[index.value_column]) if row[index.value_column] else math.nan
+            except ValueError:
+                raise IngestError('line {}: {!r} is not a year and a value'.format(
+                    line, (row['Year'], row[index.value_column])))
+            if year in stored_years:
+                raise IngestError('line {}: {} is already in {}, stored years are never rewritten'.format(
+                    line, year, index.data_file))
+            if (code, year) in seen:
+                raise IngestError('line {}: {} appears twice in {}'.format(line, code, year))
+            if math.isinf(value):
+                raise IngestError('line {}: {} is not a finite value'.format(line, row[index.value_column]))
+            seen.add((code, year))
+            added.add(year)
+            known = dict(countries.table.loc[code].dropna(), **latest.get(code, {}))
+            record = dict(known, **{name: text for name, text in row.items() if name in columns and text})
+            record.update(Code=code, Year=year, **{index.value_column: row[index.value_column]})
+            writer.writerow(['' if _missing(record.get(name)) else record[name] for name in columns])
+            count += 1
+        if not count:
+            raise IngestError('{} has no rows'.format(release))
+
+        result = {'index': index.key, 'dataset': index.data_file, 'years': sorted(added), 'rows': count,
+                  'previous_version': file_digest(path)[:12]}
+        if dry_run:
+            result['version'] = None
+            return result
+        buffer.seek(0)
+        # The new version is written next to the dataset and swapped in, so a worker reloading meanwhile
+        # only ever reads the old or the new file complete
+        path = pathlib.Path(path)
+        target = tempfile.NamedTemporaryFile('wb', dir=str(path.parent), prefix='.{}.'.format(path.name),
+                                             suffix='.tmp', delete=False)
+        try:
+            with target, open(str(path), 'rb') as stored:
+                last = b''
+                for chunk in iter(lambda: stored.read(1 << 16), b''):
+                    target.write(chunk)
+                    last = chunk[-1:]
+                # The new rows start on a line of their own, also after a file without a final line break
+                if last and last != b'\n':
+                    target.write(b'\n')
+                for chunk in iter(lambda: buffer.read(1 << 16), ''):
+                    target.write(chunk.encode('utf-8'))
+                target.flush()
+                os.fsync(target.fileno())
+            shutil.copymode(str(path), target.name)
+            os.replace(target.name, str(path))
+        except BaseException:
+            os.unlink(target.name)
+            raise
+
+    # A columnar copy of the old file is stale now and would be ignored, it is built again right away
+    if (columnar.columnar_path(path) / 'meta.json').exists():
+        columnar.build(path)
+    result['version'] = file_digest(path)[:12]
+    return result
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('index', choices=list(INDICES))
+    parser.add_argument('release', help='csv file of the release')
+    parser.add_argument('--layout', choices=LAYOUTS, default='auto')
+    parser.add_argument('--dry-run', action='store_true', help='only validate the release')
+    args = parser.parse_args()
+
+    try:
+        print(json.dumps(ingest(INDICES[args.index], args.release, args.layout, args.dry_run)))
+    except (IngestError, OSError) as error:
+        print('Not ingested: {}'.format(error), file=sys.stderr)
+        sys.exit(1)
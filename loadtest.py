@@ -0,0 +1,282 @@
+"""Load test replaying page loads and year selections through the full request path of the app.
+
+    $ python loadtest.py [--url http://127.0.0.1:8050] [--concurrency 8] [--sessions 40] [--moves 20]
+                         [--seed 1] [--output run.json]
+    $ python loadtest.py --compare before.json after.json
+
+Every virtual user loads the page like the browser does (the page, its layout and callback
+dependencies) and then moves the year sliders and the correlation year selector, mostly to a
+neighbouring year and sometimes further, each move posted to _dash-update-component as the Dash
+renderer would. Without --url the requests go to the Flask server of the app in this process, with
+it to a running app, such as the gunicorn workers. The report has the throughput and the p50, p95
+and p99 latency of every callback, --compare shows how two reports differ.
+
+Unlike benchmarks.py this measures whole requests, including routing, serialization and compression.
+"""
+import argparse
+import http.client
+import json
+import math
+import random
+import sys
+import threading
+import time
+import urllib.parse
+
+# Percentiles of the latency in the report
+PERCENTILES = (50, 95, 99)
+# Share of the moves that jump to any year instead of a neighbouring one
+JUMP_SHARE = 0.2
+HEADERS = {'Accept-Encoding': 'gzip, deflate, br', 'Content-Type': 'application/json'}
+# Requests of a page load before the first callback
+PAGE = [('page', '/'), ('layout', '/_dash-layout'), ('dependencies', '/_dash-dependencies')]
+
+
+def app_module():
+    import app
+    return app
+
+
+class LocalClient(object):
+    """Requests to the Flask server of the app in this process."""
+
+    def __init__(self):
+        self._client = app_module().server.test_client()
+
+    def request(self, method, path, body=None, headers=HEADERS):
+        response = self._client.open(path, method=method, data=body, headers=headers)
+        return response.status_code, response.data
+
+
+class HttpClient(object):
+    """Requests to a running app over one kept alive connection."""
+
+    def __init__(self, url):
+        url = urllib.parse.urlsplit(url)
+        self._prefix = url.path.rstrip('/')
+        self._connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+
+    def request(self, method, path, body=None, headers=HEADERS):
+        try:
+            self._connection.request(method, self._prefix + path, body=body, headers=headers)
+            response = self._connection.getresponse()
+            return response.status, response.read()
+        except (OSError, http.client.HTTPException):
+            # A new connection for the next request, the failed one counts as an error
+            self._connection.close()
+            return None, b''
+
+
+def percentile(values, share):
+    """Nearest rank percentile of the sorted values."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(share / 100.0 * len(values)) - 1))]
+
+
+def callback_requests(dependencies):
+    """Callbacks served by the server that a year selection triggers, with a function building their request body.
+
+    Returns (label, input id, build(value)) for every server side callback with a single input.
+    """
+    callbacks = []
+    for dependency in dependencies:
+        if dependency.get('clientside_function') or len(dependency['inputs']) != 1:
+            continue
+        output = dependency['output']
+        source = dependency['inputs'][0]
+        # '..id.prop...id.prop..' for several outputs, 'id.prop' for one
+        outputs = [part.rsplit('.', 1) for part in output.strip('.').split('...')]
+        outputs = [{'id': component, 'property': prop} for component, prop in outputs]
+
+        def build(value, output=output, outputs=outputs, source=source):
+            return json.dumps({
+                'output': output,
+                'outputs': outputs if len(outputs) > 1 else outputs[0],
+                'inputs': [dict(source, value=value)],
+                'changedPropIds': ['{}.{}'.format(source['id'], source['property'])],
+            }).encode('utf-8')
+
+        callbacks.append(('{} -> {}'.format(source['id'], outputs[0]['id']), source['id'], build))
+    return callbacks
+
+
+def choices(layout, component_id):
+    """Values a user can select on the slider or radio items of the layout and the position of the selected one."""
+    def find(node):
+        if isinstance(node, list):
+            return next((found for found in map(find, node) if found is not None), None)
+        if not isinstance(node, dict):
+            return None
+        props = node.get('props', {})
+        if props.get('id') == component_id:
+            if 'marks' in props:
+                values = sorted(int(year) for year in props['marks'])
+            else:
+                values = [option['value'] for option in props.get('options', [])]
+            return values, values.index(props['value']) if props.get('value') in values else len(values) - 1
+        return find(props.get('children'))
+    return find(layout) or ([], None)
+
+
+class LoadTest(object):
+    """Runs the virtual users on threads and collects the latency of every request by label."""
+
+    def __init__(self, concurrency=8, sessions=40, moves=20, seed=1):
+        self.concurrency = concurrency
+        self.sessions = sessions
+        self.moves = moves
+        self.seed = seed
+        self.samples = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+        self._next_session = 0
+
+    def _timed(self, client, label, method, path, body=None):
+        start = time.perf_counter()
+        status, content = client.request(method, path, body)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            if status != 200:
+                self.errors[label] = self.errors.get(label, 0) + 1
+            else:
+                self.samples.setdefault(label, []).append((elapsed, len(content)))
+
+    def _session(self, client, rng):
+        for label, path in PAGE:
+            self._timed(client, label, 'GET', path)
+        # Every selector starts at the value the page shows
+        positions = {label: position for label, _, _, position in self._callbacks}
+        for _ in range(self.moves):
+            label, values, build, _ = rng.choice(self._callbacks)
+            if rng.random() < JUMP_SHARE:
+                position = rng.randrange(len(values))
+            else:
+                position = min(len(values) - 1, max(0, positions[label] + rng.choice((-1, 1))))
+            positions[label] = position
+            self._timed(client, label, 'POST', '/_dash-update-component', build(values[position]))
+
+    def _worker(self, make_client):
+        client = make_client()
+        while True:
+            with self._lock:
+                if self._next_session >= self.sessions:
+                    return
+                session = self._next_session
+                self._next_session += 1
+            # Seeded per session, so a seed replays the same sessions whichever thread takes them
+            self._session(client, random.Random('{}/{}'.format(self.seed, session)))
+
+    def run(self, make_client):
+        """Runs all sessions and returns the report."""
+        # The callbacks are read from the layout and dependencies once up front, uncompressed, the sessions
+        # still request them every time
+        client = make_client()
+        layout, dependencies = (json.loads(client.request('GET', path, headers={})[1].decode('utf-8'))
+                                for path in ('/_dash-layout', '/_dash-dependencies'))
+        self._callbacks = [(label, values, build, position)
+                           for label, source, build in callback_requests(dependencies)
+                           for values, position in [choices(layout, source)] if values]
+        start = time.perf_counter()
+        threads = [threading.Thread(target=self._worker, args=(make_client,)) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return self.report(time.perf_counter() - start)
+
+    def report(self, seconds):
+        callbacks = {}
+        for label in sorted(set(self.samples) | set(self.errors)):
+            samples = self.samples.get(label, [])
+            latencies = sorted(elapsed for elapsed, _ in samples)
+            callbacks[label] = dict({
+                'requests': len(samples),
+                'errors': self.errors.get(label, 0),
+                'throughput': round(len(samples) / seconds, 2),
+                'mean_bytes': int(sum(size for _, size in samples) / len(samples)) if samples else 0,
+            }, **{'p{}'.format(share): percentile(latencies, share) for share in PERCENTILES})
+        total = sum(callback['requests'] for callback in callbacks.values())
+        return {
+            'settings': {'concurrency': self.concurrency, 'sessions': self.sessions, 'moves': self.moves,
+                         'seed': self.seed},
+            'seconds': round(seconds, 3),
+            'requests': total,
+            'errors': sum(callback['errors'] for callback in callbacks.values()),
+            'throughput': round(total / seconds, 2),
+            'callbacks': callbacks,
+        }
+
+
+def compare(before, after):
+    """Rows of the change of every callback from the before to the after report, as after / before ratios."""
+    rows = []
+    for label in sorted(set(before['callbacks']) | set(after['callbacks'])):
+        old, new = before['callbacks'].get(label), after['callbacks'].get(label)
+        row = {'callback': label}
+        for name in ['throughput'] + ['p{}'.format(share) for share in PERCENTILES]:
+            if old and new and old[name] and new[name] is not None:
+                row[name] = round(new[name] / old[name], 3)
+            else:
+                row[name] = None
+        rows.append(row)
+    rows.append({'callback': 'all', 'throughput': round(after['throughput'] / before['throughput'], 3)
+                 if before['throughput'] else None})
+    return rows
+
+
+def format_report(report):
+    lines = ['{:<60} {:>8} {:>6} {:>9} {:>9} {:>9} {:>9}'.format(
+        'callback', 'requests', 'errors', 'req/s', 'p50 ms', 'p95 ms', 'p99 ms')]
+    for label, callback in report['callbacks'].items():
+        lines.append('{:<60} {:>8} {:>6} {:>9.1f} {:>9} {:>9} {:>9}'.format(
+            label[:60], callback['requests'], callback['errors'], callback['throughput'],
+            *['{:.1f}'.format(callback[name] * 1000) if callback[name] is not None else '-'
+              for name in ('p50', 'p95', 'p99')]))
+    lines.append('{} requests in {:.1f}s, {:.1f} requests/s, {} errors'.format(
+        report['requests'], report['seconds'], report['throughput'], report['errors']))
+    return '\n'.join(lines)
+
+
+def format_comparison(rows):
+    lines = ['{:<60} {:>10} {:>8} {:>8} {:>8}'.format('callback (after / before)', 'req/s', 'p50', 'p95', 'p99')]
+    for row in rows:
+        lines.append('{:<60} {:>10} {:>8} {:>8} {:>8}'.format(
+            row['callback'][:60], *['{:.2f}x'.format(row[name]) if row.get(name) is not None else '-'
+                                    for name in ('throughput', 'p50', 'p95', 'p99')]))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--url', help='base url of a running app, the app is loaded in this process without it')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--sessions', type=int, default=40, help='page loads, each followed by its moves')
+    parser.add_argument('--moves', type=int, default=20, help='year selections per session')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='also write the report to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two reports and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        reports = []
+        for path in args.compare:
+            with open(path) as report:
+                reports.append(json.load(report))
+        print(format_comparison(compare(*reports)))
+        sys.exit(0)
+
+    if args.url:
+        def make_client():
+            return HttpClient(args.url)
+    else:
+        app = app_module()
+        # Measured once the background warm-up no longer competes for the CPU
+        if app.warmup is not None:
+            app.warmup.wait()
+        make_client = LocalClient
+    result = LoadTest(args.concurrency, args.sessions, args.moves, args.seed).run(make_client)
+    print(format_report(result))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(result, output, indent=2, sort_keys=True)
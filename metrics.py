@@ -0,0 +1,154 @@
+"""In-memory metrics of a worker, served in the Prometheus text format by the /metrics route.
+
+Recording an observation is a bisect and two additions under a lock, the values read from other
+objects (cache hit counts, data load time, memory) are only read when the metrics are scraped.
+Every worker keeps and reports its own metrics.
+"""
+import bisect
+import os
+import sys
+import threading
+import time
+
+from flask import g, request
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BYTES_BUCKETS = (1000, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000, 5000000)
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+class Histogram(object):
+    """Histogram with fixed buckets and one series per value of its single label."""
+
+    def __init__(self, name, description, buckets, label):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.label = label
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        bucket = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(label)
+            if series is None:
+                # Per bucket counts, the last one for values above all buckets, followed by the sum
+                series = self._series[label] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[bucket] += 1
+            series[-1] += value
+
+    def count(self, label):
+        """Number of observations of the label."""
+        with self._lock:
+            return sum(self._series.get(label, [0.0])[:-1])
+
+    def lines(self):
+        yield '# HELP {} {}'.format(self.name, self.description)
+        yield '# TYPE {} histogram'.format(self.name)
+        with self._lock:
+            series = sorted((label, list(values)) for label, values in self._series.items())
+        for label, values in series:
+            label = '{}="{}"'.format(self.label, _label(label))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), values[:-1]):
+                cumulative += count
+                yield '{}_bucket{{{},le="{}"}} {}'.format(self.name, label, bound, cumulative)
+            yield '{}_sum{{{}}} {}'.format(self.name, label, values[-1])
+            yield '{}_count{{{}}} {}'.format(self.name, label, cumulative)
+
+
+class Metrics(object):
+    """Histograms recorded by the app and values read from elsewhere when the metrics are scraped."""
+
+    def __init__(self):
+        self.callback_seconds = Histogram('egov_callback_duration_seconds', 'Time spent in a Dash callback request.',
+                                          LATENCY_BUCKETS, 'callback')
+        self.callback_bytes = Histogram('egov_callback_response_bytes', 'Size of a Dash callback response before '
+                                        'compression.', BYTES_BUCKETS, 'callback')
+        self.histograms = [self.callback_seconds, self.callback_bytes]
+        self._values = []
+
+    def value(self, name, description, read, kind='gauge'):
+        """Registers a gauge or counter whose value is returned by read() at scrape time, None leaves it out."""
+        self._values.append((name, description, read, kind))
+
+    def render(self):
+        """All metrics in the Prometheus text format."""
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.lines())
+        for name, description, read, kind in self._values:
+            value = read()
+            if value is not None:
+                lines.extend(['# HELP {} {}'.format(name, description),
+                              '# TYPE {} {}'.format(name, kind),
+                              '{} {}'.format(name, value)])
+        return '\n'.join(lines) + '\n'
+
+
+def rss_bytes():
+    """Resident memory of the worker process, its peak where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Reported in bytes on macOS and in kilobytes elsewhere
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def memory_report(datasets, countries, caches=()):
+    """Bytes held by every dataset and the structures derived from it, the countries dimension table, the
+    categories they share and each of the caches.
+
+    The categories are counted once for all frames. Measuring a cache serializes its entries, so
+    leaving the caches out keeps the report cheap enough to take on every scrape.
+    """
+    categories = {}
+    report = {
+        'datasets': {},
+        'countries': {'rows': len(countries), 'bytes': countries.memory_usage(categories)},
+        'caches': {cache.name: cache.memory_usage() for cache in caches},
+    }
+    for key, data in datasets.items():
+        parts = data.memory_usage(categories)
+        report['datasets'][key] = {'rows': len(data), 'bytes': sum(parts.values()), 'parts': parts}
+    report['categories'] = {'count': len(categories), 'bytes': sum(categories.values())}
+    report['total'] = sum(part['bytes'] for part in report['datasets'].values()) + report['countries']['bytes'] + \
+        report['categories']['bytes'] + sum(cache['bytes'] for cache in report['caches'].values())
+    return report
+
+
+def instrument_callbacks(server, metrics, path, callbacks):
+    """Records the latency and response size of every Dash callback request to the server.
+
+    Requests are labelled by the outputs of their callback, anything that is not a key of callbacks
+    is counted as 'other' so that requests cannot add series.
+    """
+    @server.before_request
+    def start_callback_timer():
+        if request.path == path:
+            g.callback_start = time.perf_counter()
+
+    # Registered after Flask-Compress, so it runs before the response is compressed
+    @server.after_request
+    def record_callback(response):
+        start = g.pop('callback_start', None)
+        if start is not None:
+            output = (request.get_json(silent=True) or {}).get('output')
+            label = output if output in callbacks else 'other'
+            metrics.callback_seconds.observe(label, time.perf_counter() - start)
+            # Responses answered already compressed record their size before compression, see responses.py
+            size = g.pop('callback_bytes', None)
+            metrics.callback_bytes.observe(label, size if size is not None else response.calculate_content_length() or 0)
+        return response
@@ -0,0 +1,63 @@
+/* Year selection of the static export of the dashboard, see prerender.py.
+   The page holds the rendered layout and a bundle config naming the content hashed figure and
+   year files, which are fetched on demand and merged into the plots as the live app does. */
+(function () {
+    var config = JSON.parse(document.getElementById('static-bundle').textContent);
+    var files = {};
+    var plots = {};
+
+    function load(url) {
+        if (!files[url]) {
+            files[url] = fetch(url).then(function (response) {
+                return response.json();
+            });
+        }
+        return files[url];
+    }
+
+    function plot(id, url) {
+        return load(url).then(function (figure) {
+            return Plotly.newPlot(id, figure.data, figure.layout, {responsive: true});
+        });
+    }
+
+    /* Same properties as generators.generate_year_update and maps.apply_update in assets/clientside.js */
+    function showYear(map, year) {
+        Promise.all([plots[map.graph], load(map.years[year])]).then(function (loaded) {
+            var selected = loaded[1];
+            Plotly.update(map.graph, {
+                locations: [selected.update.locations],
+                z: [selected.update.z],
+                text: [selected.update.text],
+                'colorbar.title.text': selected.update.colorbar
+            }, {'title.text': selected.update.title});
+            document.getElementById(map.title).textContent = selected.title;
+            document.getElementById(map.table).innerHTML = selected.table;
+        });
+    }
+
+    config.maps.forEach(function (map) {
+        var slider = document.getElementById(map.slider);
+        var years = JSON.parse(slider.getAttribute('data-years'));
+        plots[map.graph] = plot(map.graph, map.figure);
+        slider.addEventListener('input', function () {
+            showYear(map, years[slider.value]);
+        });
+    });
+
+    if (config.correlation) {
+        var correlation = config.correlation;
+        var showCorrelation = function (year) {
+            load(correlation.years[year]).then(function (selected) {
+                Plotly.react(correlation.graph, selected.figure.data, selected.figure.layout);
+                document.getElementById(correlation.statistics).innerHTML = selected.statistics;
+            });
+        };
+        document.querySelectorAll('input[name="' + correlation.radio + '"]').forEach(function (radio) {
+            radio.addEventListener('change', function () {
+                showCorrelation(radio.value);
+            });
+        });
+        showCorrelation(correlation.selected);
+    }
+})();
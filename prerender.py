@@ -0,0 +1,277 @@
+"""Static export of the dashboard for hosting on a CDN or any static file server.
+
+    $ python prerender.py [--output build/static] [--force]
+
+Renders the layout of the app to index.html and writes the map figure of every index, the map update,
+heading and top 15 table of every year and the correlation scatter of every year to JSON files, next
+to the dataset files of the download buttons, the assets and plotly.js. prerender.js fetches them when
+a slider or year selector changes, so no Python process is needed to serve the dashboard. All files but
+index.html and manifest.json are named by the hash of their contents and can be cached forever.
+
+manifest.json records a hash of the rows every file was built from, a later export only builds the
+files of the years whose rows changed, and the map figure when the latest year did, and removes the
+files no longer used.
+"""
+import argparse
+import hashlib
+import html as markup
+import importlib
+import json
+import os
+import pathlib
+import re
+
+import pandas as pd
+import plotly
+
+FORMAT_VERSION = 1
+MANIFEST = 'manifest.json'
+SCRIPT = pathlib.Path(__file__).with_name('prerender.js')
+# Only needed by the Dash callbacks of the live app
+SKIPPED_ASSETS = {'clientside.js'}
+VOID_TAGS = {'br', 'hr', 'img', 'input'}
+# Component properties that are not html attributes
+SKIPPED_PROPS = {'children', 'className', 'style', 'n_clicks', 'n_clicks_timestamp', 'key', 'loading_state'}
+
+
+def app_module():
+    # The modes of the app are left as they are, the export renders its own data files and asks for the
+    # layout with the top rows tables it renders statically
+    import app
+    return app
+
+
+def content_name(name, body):
+    """File name of the body, with the first 12 characters of its SHA-1 before the suffix."""
+    path = pathlib.PurePosixPath(name)
+    return str(path.with_name('{}.{}{}'.format(path.stem, hashlib.sha1(body).hexdigest()[:12], path.suffix)))
+
+
+def year_digest(rows):
+    """Content hash of the rows of one year, the source of the files built from them."""
+    values = pd.util.hash_pandas_object(rows, index=False).to_numpy()
+    return hashlib.sha1(values.tobytes()).hexdigest()
+
+
+def to_json(value):
+    return json.dumps(value, cls=plotly.utils.PlotlyJSONEncoder, separators=(',', ':')).encode('utf-8')
+
+
+def _style(style):
+    # Dash accepts both css and camel case property names
+    return ';'.join('{}:{}'.format(re.sub('([A-Z])', lambda upper: '-' + upper.group(1).lower(), name), value)
+                    for name, value in style.items())
+
+
+def _attributes(attributes):
+    return ''.join(' {}="{}"'.format(name, markup.escape(str(value))) for name, value in attributes.items()
+                   if value is not None)
+
+
+def render(component):
+    """Static html of a Dash component tree, dcc components become the elements prerender.js drives."""
+    if component is None:
+        return ''
+    if isinstance(component, (list, tuple)):
+        return ''.join(render(child) for child in component)
+    if isinstance(component, dict) and {'type', 'namespace', 'props'} <= set(component):
+        component = _component(component)
+    if not hasattr(component, '_type'):
+        return markup.escape(str(component))
+    attributes = {'id': getattr(component, 'id', None), 'class': getattr(component, 'className', None)}
+    if getattr(component, 'style', None):
+        attributes['style'] = _style(component.style)
+    if component._namespace == 'dash_core_components':
+        return _render_core(component, attributes)
+    if component._namespace != 'dash_html_components':
+        raise ValueError('Cannot render {}.{} statically'.format(component._namespace, component._type))
+    tag = component._type.lower()
+    for name in component._prop_names:
+        if name not in SKIPPED_PROPS and name not in ('id',) and getattr(component, name, None) is not None:
+            attributes[name.lower()] = getattr(component, name)
+    if tag in VOID_TAGS:
+        return '<{}{}>'.format(tag, _attributes(attributes))
+    return '<{0}{1}>{2}</{0}>'.format(tag, _attributes(attributes), render(getattr(component, 'children', None)))
+
+
+def _component(node):
+    """Component of its JSON form, as the shared cache and the warm-up processes hand out cached tables."""
+    return getattr(importlib.import_module(node['namespace']), node['type'])(**node['props'])
+
+
+def _render_core(component, attributes):
+    if component._type == 'Store':
+        return ''
+    if component._type == 'Graph':
+        attributes['class'] = 'static-graph'
+        return '<div{}></div>'.format(_attributes(attributes))
+    if component._type == 'Slider':
+        # The years are not evenly spaced, so the range input moves over their positions
+        years = sorted(int(year) for year in component.marks)
+        attributes.update({'type': 'range', 'min': 0, 'max': len(years) - 1, 'step': 1,
+                           'value': years.index(component.value), 'data-years': json.dumps(years)})
+        marks = ''.join('<span>{}</span>'.format(year) for year in years)
+        return '<div class="static-slider"><input{}><div class="static-slider-marks">{}</div></div>'.format(
+            _attributes(attributes), marks)
+    if component._type == 'RadioItems':
+        label_style = _style(component.labelStyle or {})
+        options = ''.join(
+            '<label style="{}"><input type="radio" name="{}" value="{}"{}>{}</label>'.format(
+                markup.escape(label_style), markup.escape(component.id), markup.escape(str(option['value'])),
+                ' checked' if option['value'] == component.value else '', markup.escape(option['label']))
+            for option in component.options)
+        return '<div{}>{}</div>'.format(_attributes(attributes), options)
+    raise ValueError('Cannot render dash_core_components.{} statically'.format(component._type))
+
+
+class Bundle(object):
+    """Output directory of an export, reusing the files of the previous export whose source is unchanged."""
+
+    def __init__(self, output, force=False):
+        self.output = pathlib.Path(output)
+        self.output.mkdir(parents=True, exist_ok=True)
+        try:
+            manifest = json.loads((self.output / MANIFEST).read_text())
+        except (OSError, ValueError):
+            manifest = {}
+        self.previous = manifest.get('files', {}) if manifest.get('version') == FORMAT_VERSION else {}
+        self.force = force
+        self.files = {}
+        self.built = []
+        self.reused = []
+
+    def add(self, name, source, build):
+        """Path of the file of the logical name, built with build() unless the previous export has it for source."""
+        previous = self.previous.get(name)
+        if not self.force and previous is not None and previous['source'] == source and \
+                (self.output / previous['file']).exists():
+            self.files[name] = previous
+            self.reused.append(name)
+            return previous['file']
+        body = build()
+        path = content_name(name, body)
+        target = self.output / path
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(body)
+        self.files[name] = {'file': path, 'source': source}
+        self.built.append(name)
+        return path
+
+    def add_file(self, name, path):
+        """Copies the file under its content hashed name, its contents are its source."""
+        body = pathlib.Path(path).read_bytes()
+        return self.add(name, hashlib.sha1(body).hexdigest(), lambda: body)
+
+    def finish(self, index_html):
+        """Writes index.html and the manifest and removes the files of the previous export no longer used."""
+        (self.output / 'index.html').write_bytes(index_html.encode('utf-8'))
+        used = {entry['file'] for entry in self.files.values()}
+        removed = sorted({entry['file'] for entry in self.previous.values()} - used)
+        for path in removed:
+            if (self.output / path).exists():
+                (self.output / path).unlink()
+        (self.output / MANIFEST).write_text(json.dumps({'version': FORMAT_VERSION, 'files': self.files},
+                                                       indent=1, sort_keys=True))
+        return removed
+
+
+def export(output, force=False, snapshot=None):
+    """Exports the dashboard of the snapshot, the live one by default, to the output directory.
+
+    Returns the logical names of the files that were built, reused and removed.
+    """
+    app = app_module()
+    from generators import generate_correlation_scatter, generate_map, generate_year_update, correlation_key
+    snapshot = snapshot or app.reloader.current
+    bundle = Bundle(output, force)
+
+    # Assets keep their names in the layout and figures, which are rewritten to the hashed files
+    assets = {}
+    for path in sorted(pathlib.Path(app.app.config.assets_folder).iterdir()):
+        if path.is_file() and path.name not in SKIPPED_ASSETS:
+            assets['assets/' + path.name] = bundle.add_file('assets/' + path.name, path)
+    plotly_js = bundle.add_file('assets/plotly.min.js',
+                                os.path.join(os.path.dirname(plotly.__file__), 'package_data', 'plotly.min.js'))
+    script = bundle.add_file('assets/prerender.js', SCRIPT)
+
+    def with_assets(figure):
+        figure = json.loads(to_json(figure))
+        for image in figure['layout'].get('images', []):
+            if image['source'] not in assets:
+                raise ValueError('The figure uses {}, which is not in the assets'.format(image['source']))
+            image['source'] = assets[image['source']]
+        return to_json(figure)
+
+    # The download buttons link the dataset files of the live app, which become files of the bundle
+    downloads = {}
+    config = {'maps': [], 'correlation': None}
+    for index in app.INDICES.values():
+        data = snapshot.datasets[index.key]
+        downloads[app.file_download_link(index.data_file).children[0].href] = bundle.add_file(
+            'data/' + index.data_file, index.path)
+        # Files of a year only change with the rows of that year, the map figure with those of the latest year
+        digests = {year: year_digest(data.year(year)) for year in data.years}
+        latest = data.years[-1]
+        figure = bundle.add('{}/figure.json'.format(index.key), '{}/{}'.format(latest, digests[latest]),
+                            lambda: with_assets(generate_map(index, data, latest)))
+        years = {}
+        for year in data.years:
+            source = '{}/{}'.format(year, digests[year])
+            years[year] = bundle.add('{}/{}.json'.format(index.key, year), source, lambda: to_json({
+                'update': generate_year_update(index, data, year),
+                'title': 'TOP 15 countries in ' + str(year),
+                'table': render(app.ranking_table(index, data, year)),
+            }))
+        config['maps'].append({'slider': index.slider_id, 'graph': index.graph_id, 'title': index.title_id,
+                               'table': index.table_id, 'figure': figure, 'years': years})
+
+    correlations = snapshot.correlations
+    if correlations.years:
+        years = {}
+        for year in [app.POOLED] + correlations.years:
+            years[year] = bundle.add('correlation/{}.json'.format(year), correlation_key(correlations, year),
+                                     lambda: to_json({
+                                         'figure': generate_correlation_scatter(correlations.points(year),
+                                                                                correlations.statistics(year)),
+                                         'statistics': render(app.correlation_statistics(correlations, year)),
+                                     }))
+        config['correlation'] = {'radio': 'correlation-year', 'graph': 'correlation-scatter',
+                                 'statistics': 'correlation-statistics', 'selected': app.POOLED, 'years': years}
+
+    body = render(app.build_layout(snapshot, paged=False))
+    for name, path in list(assets.items()) + list(downloads.items()):
+        body = body.replace('"{}"'.format(markup.escape(name)), '"{}"'.format(path))
+    stylesheets = list(app.external_stylesheets) + [path for name, path in assets.items() if name.endswith('.css')]
+    index_html = '\n'.join([
+        '<!DOCTYPE html>',
+        '<html>',
+        '<head>',
+        '<meta charset="utf-8">',
+        '<title>{}</title>'.format(markup.escape(app.app.title)),
+        ''.join('<link rel="stylesheet" href="{}">'.format(markup.escape(href)) for href in stylesheets),
+        '<link rel="icon" href="{}">'.format(assets['assets/favicon.ico']) if 'assets/favicon.ico' in assets else '',
+        '</head>',
+        '<body>',
+        body,
+        # Closing tags in the config could end the script element early
+        '<script type="application/json" id="static-bundle">{}</script>'.format(
+            json.dumps(config).replace('</', '<\\/')),
+        '<script src="{}"></script>'.format(plotly_js),
+        '<script src="{}"></script>'.format(script),
+        '</body>',
+        '</html>',
+    ])
+    removed = bundle.finish(index_html)
+    return {'built': bundle.built, 'reused': bundle.reused, 'removed': removed}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--output', default=os.path.join('build', 'static'))
+    parser.add_argument('--force', action='store_true', help='build all files again, even where the data is unchanged')
+    args = parser.parse_args()
+
+    result = export(args.output, args.force)
+    print('Exported to {}: {} files built, {} unchanged, {} removed'.format(
+        args.output, len(result['built']), len(result['reused']), len(result['removed'])))
@@ -0,0 +1,72 @@
+"""Callback responses serialized and compressed once, answered with their ETag before Dash runs the callback.
+
+A map callback sends every user the same response for the same data version and year. The first
+request is answered by Dash as usual, its body is then kept with its gzip and brotli encodings and
+a hash of its contents. Later requests for it are answered from those bytes, without running the
+callback, serializing its result or compressing it again, and a request sending the ETag back in
+If-None-Match gets a 304 without a body.
+"""
+import gzip
+import hashlib
+
+import brotli
+from flask import Response, g, request
+
+# Encodings in the order they are preferred when the request accepts several
+ENCODINGS = ('br', 'gzip')
+
+
+class EncodedResponse(object):
+    """Response body with its precomputed encodings and the ETag of its contents."""
+
+    def __init__(self, body, mimetype='application/json'):
+        self.mimetype = mimetype
+        self.size = len(body)
+        self.etag = hashlib.sha1(body).hexdigest()
+        self.bodies = {'identity': body, 'gzip': gzip.compress(body, 9), 'br': brotli.compress(body)}
+
+    def response(self):
+        """Response to the current request in the best encoding it accepts, 304 when it has the ETag."""
+        if request.if_none_match.contains(self.etag):
+            response = Response(status=304)
+            g.callback_bytes = 0
+        else:
+            encoding = next((name for name in ENCODINGS if request.accept_encodings[name]), 'identity')
+            response = Response(self.bodies[encoding], mimetype=self.mimetype)
+            if encoding != 'identity':
+                response.headers['Content-Encoding'] = encoding
+            # The callback metrics count the size before compression
+            g.callback_bytes = self.size
+        response.headers['Vary'] = 'Accept-Encoding'
+        response.set_etag(self.etag)
+        return response
+
+
+def serve_cached_responses(server, path, cache, resolve):
+    """Answers the requests to path that resolve() gives a cache key (dataset, year) for from the cache.
+
+    A request whose response is not cached yet goes on to Dash, and its response is added to the
+    cache on the way out. Registered after instrument_callbacks, so cached answers are still timed.
+    """
+    @server.before_request
+    def cached_response():
+        if request.path != path or request.method != 'POST':
+            return None
+        key = resolve()
+        if key is None:
+            return None
+        encoded = cache.lookup(*key)
+        if encoded is None:
+            g.response_key = key
+            return None
+        return encoded.response()
+
+    # Runs before Flask-Compress, which leaves the already encoded response as it is
+    @server.after_request
+    def cache_response(response):
+        key = g.pop('response_key', None)
+        if key is None or response.status_code != 200 or response.direct_passthrough:
+            return response
+        encoded = EncodedResponse(response.get_data(), response.mimetype)
+        cache.put(key[0], key[1], encoded)
+        return encoded.response()
@@ -0,0 +1,182 @@
+"""Measures the memory and startup time of the app under gunicorn, in the plain and the production profile.
+
+    $ python serverprofile.py [--workers 4] [--threads 2] [--load] [--output profile.json]
+
+plain runs `gunicorn app:server` as the Procfile did before, every worker importing the app, loading the
+data and warming its caches by itself. preload runs the profile of gunicorn.conf.py, which loads once in
+the master and forks the workers from it. Both get the same number of workers.
+
+For every profile the report has the seconds until the first page layout is served (ready), until all
+processes stopped using the CPU for the startup (settled) and the processor seconds that took, and the
+total resident (RSS) and proportional (PSS) memory of the master and its workers. RSS counts the pages
+the workers share copy-on-write once in every one of them, PSS splits them between them. With --load
+the load test of loadtest.py runs against the server and the memory is read again after it.
+
+Only runs on Linux, the memory is read from /proc.
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import loadtest
+
+PROFILES = ('plain', 'preload')
+ROOT = os.path.dirname(os.path.abspath(__file__))
+# Tick length of the processor times in /proc/<pid>/stat
+TICK = os.sysconf('SC_CLK_TCK') if hasattr(os, 'sysconf') else 100
+# The startup has settled once the processes used less CPU than this over the interval
+SETTLE_CPU = 0.05
+SETTLE_INTERVAL = 1.0
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def command(profile, port, workers, threads):
+    """Command line and environment of gunicorn in the profile."""
+    if profile == 'plain':
+        # Without a config file, gunicorn would otherwise read gunicorn.conf.py from the working directory
+        return (['gunicorn', '--config', os.devnull, '--bind', '127.0.0.1:{}'.format(port),
+                 '--workers', str(workers), 'app:server'], {})
+    return (['gunicorn', '--config', 'gunicorn.conf.py', '--bind', '127.0.0.1:{}'.format(port), 'app:server'],
+            {'WEB_CONCURRENCY': str(workers), 'EGOV_THREADS': str(threads)})
+
+
+def process_tree(pid):
+    """Process id and ids of all descendants."""
+    pids = [pid]
+    for parent in pids:
+        try:
+            with open('/proc/{}/task/{}/children'.format(parent, parent)) as children:
+                pids.extend(int(child) for child in children.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def _status_kb(pid, path, field):
+    try:
+        with open('/proc/{}/{}'.format(pid, path)) as status:
+            for line in status:
+                if line.startswith(field + ':'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def memory(pid):
+    """Number of processes and their total RSS and PSS in bytes."""
+    pids = process_tree(pid)
+    return {'processes': len(pids),
+            'rss_bytes': sum(_status_kb(each, 'status', 'VmRSS') for each in pids) << 10,
+            'pss_bytes': sum(_status_kb(each, 'smaps_rollup', 'Pss') for each in pids) << 10}
+
+
+def cpu_seconds(pid):
+    """User and system processor seconds of the process and its descendants, including ended children."""
+    total = 0
+    for each in process_tree(pid):
+        try:
+            with open('/proc/{}/stat'.format(each)) as stat:
+                # The name in parentheses may hold spaces, the times are the 14th to 17th fields
+                fields = stat.read().rsplit(')', 1)[1].split()
+            total += sum(int(value) for value in fields[11:15])
+        except (OSError, IndexError):
+            pass
+    return total / TICK
+
+
+def wait_ready(url, process, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError('gunicorn exited with {}'.format(process.returncode))
+        try:
+            with urllib.request.urlopen(url + '/_dash-layout', timeout=timeout) as response:
+                if response.status == 200:
+                    return
+        except (OSError, urllib.error.URLError):
+            time.sleep(0.05)
+    raise RuntimeError('{} was not ready after {}s'.format(url, timeout))
+
+
+def wait_settled(pid, workers, timeout):
+    """Waits until all workers run and the processes stopped using the CPU, returns when they last did."""
+    deadline = time.perf_counter() + timeout
+    used = cpu_seconds(pid)
+    last_busy = time.perf_counter()
+    while time.perf_counter() < deadline:
+        time.sleep(SETTLE_INTERVAL)
+        now = cpu_seconds(pid)
+        if now - used > SETTLE_CPU or len(process_tree(pid)) < workers + 1:
+            last_busy = time.perf_counter()
+        elif time.perf_counter() - last_busy >= SETTLE_INTERVAL:
+            return last_busy
+        used = now
+    return last_busy
+
+
+def measure(profile, workers=4, threads=2, load=False, timeout=300):
+    """Starts gunicorn in the profile and returns its startup times and memory, and the load test report with load."""
+    port = free_port()
+    url = 'http://127.0.0.1:{}'.format(port)
+    args, env = command(profile, port, workers, threads)
+    with tempfile.TemporaryFile() as log:
+        start = time.perf_counter()
+        process = subprocess.Popen(args, cwd=ROOT, env=dict(os.environ, **env), stdout=log, stderr=log)
+        try:
+            wait_ready(url, process, timeout)
+            ready = time.perf_counter() - start
+            settled = wait_settled(process.pid, workers, timeout) - start
+            result = {'profile': profile, 'workers': workers, 'threads': threads if profile == 'preload' else 1,
+                      'ready_seconds': round(ready, 2), 'settled_seconds': round(settled, 2),
+                      'cpu_seconds': round(cpu_seconds(process.pid), 2), 'memory': memory(process.pid)}
+            if load:
+                result['load'] = loadtest.LoadTest(concurrency=2 * workers).run(lambda: loadtest.HttpClient(url))
+                result['memory_after_load'] = memory(process.pid)
+            return result
+        except RuntimeError:
+            log.seek(0)
+            sys.stderr.write(log.read().decode('utf-8', 'replace'))
+            raise
+        finally:
+            process.terminate()
+            process.wait(timeout)
+
+
+def format_results(results):
+    lines = ['{:<10} {:>8} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(
+        'profile', 'ready s', 'settle s', 'cpu s', 'processes', 'RSS MB', 'PSS MB', 'req/s')]
+    for result in results:
+        lines.append('{:<10} {:>8} {:>8} {:>10} {:>10} {:>10.1f} {:>10.1f} {:>10}'.format(
+            result['profile'], result['ready_seconds'], result['settled_seconds'], result['cpu_seconds'],
+            result['memory']['processes'], result['memory']['rss_bytes'] / 2 ** 20, result['memory']['pss_bytes'] / 2 ** 20,
+            result['load']['throughput'] if 'load' in result else '-'))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=2, help='threads of every worker of the preload profile')
+    parser.add_argument('--profiles', nargs='+', choices=PROFILES, default=list(PROFILES))
+    parser.add_argument('--load', action='store_true', help='also run the load test against every profile')
+    parser.add_argument('--output', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = [measure(profile, args.workers, args.threads, args.load) for profile in args.profiles]
+    print(format_results(results))
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump(results, output, indent=2, sort_keys=True)
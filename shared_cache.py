@@ -0,0 +1,128 @@
+"""Cache of serialized figures and tables shared by all workers of a host, in one SQLite file.
+
+The per-worker caches look a miss up here before building, so a figure or table is built by one
+worker and reused by all others, and a worker started later does not start cold. Keys include the
+version of the data, so entries of replaced data are never served and simply age out. The file is
+bounded in size by evicting the least recently used entries.
+
+The cache is optional: an SQLite error, such as a file that cannot be opened or a database locked
+beyond the timeout, is counted in errors and the lookup is answered as a miss, so the worker builds
+the entry itself.
+"""
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    value BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_used ON entries (used);
+"""
+
+
+class SharedCache(object):
+    """Size-bounded LRU store of bytes by key, safe to use from several threads and processes at once."""
+
+    def __init__(self, path, max_bytes=256 << 20, timeout=30):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        # SQLite errors of lookups and stores, which were then answered as misses or skipped
+        self.errors = 0
+        self._local = threading.local()
+        try:
+            self._connection()
+        except sqlite3.Error as error:
+            self.errors += 1
+            print('Shared cache {} unavailable, workers build their own entries: {}'.format(path, error), file=sys.stderr)
+
+    def _connection(self):
+        # One connection per thread, and a new one after a fork, as sqlite connections must not be shared
+        pid, connection = getattr(self._local, 'connection', (None, None))
+        if pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            try:
+                # Readers do not block the writer and the other way round
+                connection.execute('PRAGMA journal_mode=WAL')
+                connection.execute('PRAGMA synchronous=NORMAL')
+                connection.executescript(SCHEMA)
+            except sqlite3.Error:
+                connection.close()
+                raise
+            self._local.connection = os.getpid(), connection
+        return connection
+
+    def get(self, key):
+        """Returns the bytes stored under the key, or None when it is not stored or the cache failed."""
+        try:
+            connection = self._connection()
+            row = connection.execute('SELECT value FROM entries WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            connection.execute('UPDATE entries SET used = ? WHERE key = ?', (time.time(), key))
+            return bytes(row[0])
+        except sqlite3.Error:
+            self.errors += 1
+            return None
+
+    def put(self, key, value):
+        """Stores the bytes under the key, evicting the least recently used entries beyond max_bytes.
+
+        Returns whether the entry was stored.
+        """
+        if len(value) > self.max_bytes:
+            return False
+        try:
+            connection = self._connection()
+            # Taking the write lock up front, so that the size check and the eviction see the same entries
+            connection.execute('BEGIN IMMEDIATE')
+        except sqlite3.Error:
+            self.errors += 1
+            return False
+        try:
+            connection.execute('INSERT OR REPLACE INTO entries (key, value, size, used) VALUES (?, ?, ?, ?)',
+                               (key, sqlite3.Binary(value), len(value), time.time()))
+            excess = connection.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0] - self.max_bytes
+            if excess > 0:
+                evicted = []
+                for evicted_key, size in connection.execute('SELECT key, size FROM entries ORDER BY used'):
+                    if excess <= 0:
+                        break
+                    evicted.append((evicted_key,))
+                    excess -= size
+                connection.executemany('DELETE FROM entries WHERE key = ?', evicted)
+            connection.execute('COMMIT')
+            return True
+        except sqlite3.Error:
+            self.errors += 1
+            try:
+                connection.execute('ROLLBACK')
+            except sqlite3.Error:
+                pass
+            return False
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+
+    def size(self):
+        """Total bytes stored."""
+        return self._connection().execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM entries').fetchone()[0]
+
+    def __contains__(self, key):
+        return self._connection().execute('SELECT 1 FROM entries WHERE key = ?', (key,)).fetchone() is not None
+
+    def clear(self):
+        self._connection().execute('DELETE FROM entries')
@@ -0,0 +1,129 @@
+"""Versioned snapshots of the loaded data files, reloaded in the background when the files change.
+
+Readers take Reloader.current once per request and only use that snapshot. A reload builds a complete
+new snapshot next to the live one and then swaps the reference, so a request never sees a mix of two
+data versions and the workers never have to be restarted for a new release of the data.
+"""
+import hashlib
+import os
+import threading
+import time
+import traceback
+
+
+def file_stamp(path):
+    """Modification time and size of the file, None if it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-1 of the file contents, None if it does not exist."""
+    digest = hashlib.sha1()
+    try:
+        with open(path, 'rb') as source:
+            for chunk in iter(lambda: source.read(chunk_size), b''):
+                digest.update(chunk)
+    except OSError:
+        return None
+    return digest.hexdigest()
+
+
+class Snapshot(object):
+    """One version of the loaded data, the keyword arguments become its attributes and are never modified."""
+
+    def __init__(self, stamps, digests, **data):
+        self.stamps = stamps
+        self.digests = digests
+        # Short id of the contents of all files
+        self.version = hashlib.sha1(repr(sorted(digests.items())).encode()).hexdigest()[:12]
+        self.data = data
+        self.__dict__.update(data)
+
+    def replace(self, stamps=None, **data):
+        """Copy of the snapshot with some of its data, or only its file stamps, replaced."""
+        return Snapshot(self.stamps if stamps is None else stamps, self.digests, **dict(self.data, **data))
+
+
+class Reloader(object):
+    """Holds the live Snapshot of the named files and swaps in a new one when they change.
+
+    build(files, digests, previous) loads the data of a new snapshot as a dict, previous is the live
+    snapshot (None on the first load) so that the data of unchanged files can be reused.
+    on_swap(previous, snapshot) is called after every swap, to drop what was cached for the old data.
+    """
+
+    def __init__(self, files, build, on_swap=None):
+        self.files = dict(files)
+        self._build = build
+        self._on_swap = on_swap
+        self._lock = threading.Lock()
+        # Stamps of the files the last failed reload was built from, not retried until they change again
+        self._failed = None
+        self.reloads = 0
+        # Seconds the last successful load took
+        self.load_seconds = None
+        self.current = None
+        self.reload()
+
+    def stamps(self):
+        return {name: file_stamp(path) for name, path in self.files.items()}
+
+    def changed(self):
+        """Whether the modification time or size of any of the files differs from the live snapshot."""
+        stamps = self.stamps()
+        return stamps != self.current.stamps and stamps != self._failed
+
+    def reload(self):
+        """Builds and swaps in a new snapshot if the files changed, returns whether the data was replaced."""
+        with self._lock:
+            previous = self.current
+            # Stamped before hashing, a file written meanwhile is then picked up again by the next check
+            stamps = self.stamps()
+            if previous is not None and stamps == previous.stamps:
+                return False
+            digests = {name: file_digest(path) for name, path in self.files.items()}
+            if previous is not None and digests == previous.digests:
+                # Touched but not changed, the data is kept as it is
+                self.current = previous.replace(stamps)
+                return False
+            start = time.perf_counter()
+            try:
+                snapshot = Snapshot(stamps, digests, **self._build(self.files, digests, previous))
+            except Exception:
+                self._failed = stamps
+                raise
+            self.load_seconds = time.perf_counter() - start
+            self.current = snapshot
+            self.reloads += 1
+            if previous is not None and self._on_swap is not None:
+                self._on_swap(previous, snapshot)
+        return True
+
+    def reload_in_background(self):
+        """Reloads from a background thread, the live snapshot keeps serving until the new one is built."""
+        thread = threading.Thread(target=self._reload_logged, name='data-reload', daemon=True)
+        thread.start()
+        return thread
+
+    def watch(self, interval):
+        """Checks the files every interval seconds from a background thread and reloads them when they change."""
+        def poll():
+            while True:
+                time.sleep(interval)
+                if self.changed():
+                    self._reload_logged()
+
+        thread = threading.Thread(target=poll, name='data-watch', daemon=True)
+        thread.start()
+        return thread
+
+    def _reload_logged(self):
+        # A file that fails to load keeps the previous snapshot live until it is fixed
+        try:
+            self.reload()
+        except Exception:
+            traceback.print_exc()
@@ -0,0 +1,114 @@
+"""Synthetic datasets in the layout of the UN and EU datasets, for load and capacity testing.
+
+    $ python synthetic.py --regions 50000 --years 50 --output data/synthetic
+
+writes synthetic-un.csv and synthetic-eu.csv with the columns of DATA_UN and DATA_EU. Point the
+app at them with EGOV_DATA_DIR=data/synthetic EGOV_DATA_UN=synthetic-un.csv EGOV_DATA_EU=synthetic-eu.csv.
+"""
+import argparse
+import pathlib
+
+import numpy as np
+import pandas as pd
+
+# Column layout and value range of each dataset layout
+LAYOUTS = {
+    'un': {
+        'columns': ['Czech name', 'English name', 'Code', 'UN eGov index', 'Year', 'EU28'],
+        'value_column': 'UN eGov index',
+        'range': (0.0, 1.0),
+        'decimals': 4,
+    },
+    'eu': {
+        'columns': ['EU-code', 'Czech name', 'English name', 'Code', 'EU eGov index', 'Year', 'EU28'],
+        'value_column': 'EU eGov index',
+        'range': (10.0, 90.0),
+        'decimals': 3,
+    },
+}
+
+
+def region_names(regions, base):
+    """Codes and names of the synthetic regions, the countries of the base frame first and then numbered copies."""
+    countries = base.drop_duplicates('Code')[['Code', 'English name', 'Czech name']].reset_index(drop=True)
+    copy, country = np.divmod(np.arange(regions), len(countries))
+    suffix = pd.Series(copy).map(lambda number: '' if number == 0 else '-{}'.format(number))
+    picked = countries.iloc[country].reset_index(drop=True)
+    return pd.DataFrame({
+        'Code': picked['Code'].astype(str) + suffix,
+        'English name': picked['English name'].astype(str) + suffix.str.replace('-', ' ', regex=False),
+        'Czech name': picked['Czech name'].astype(str) + suffix.str.replace('-', ' ', regex=False),
+    })
+
+
+def _repeat(values, region):
+    """Categorical of the per-region values taken at the given region positions."""
+    categorical = pd.Categorical(values)
+    return pd.Categorical.from_codes(categorical.codes[region], categorical.categories)
+
+
+def generate(layout, regions, years, first_year=2000, base=None, seed=0):
+    """Returns a frame in the given layout with regions x years rows of plausible scores.
+
+    Every region gets a base level and a yearly trend plus noise, clipped to the range of the real index.
+    """
+    spec = LAYOUTS[layout]
+    if base is None:
+        base = pd.read_csv('data/eGov-t5.csv')
+    rng = np.random.default_rng(seed)
+    names = region_names(regions, base)
+    low, high = spec['range']
+    level = rng.uniform(0.2, 0.8, regions)
+    trend = rng.normal(0.005, 0.005, regions)
+    steps = np.arange(years)
+    scores = level[None, :] + trend[None, :] * steps[:, None] + rng.normal(0, 0.02, (years, regions))
+    scores = np.round(low + np.clip(scores, 0, 1) * (high - low), spec['decimals'])
+
+    # Region columns are categoricals repeated per year, so even millions of rows stay cheap to build
+    region = np.tile(np.arange(regions), years)
+    frame = pd.DataFrame({
+        'EU-code': _repeat(names['Code'].str[:2], region),
+        'Czech name': _repeat(names['Czech name'], region),
+        'English name': _repeat(names['English name'], region),
+        'Code': _repeat(names['Code'], region),
+        spec['value_column']: scores.ravel(),
+        'Year': np.repeat(first_year + steps, regions).astype(np.int16),
+        'EU28': (rng.random(regions) < 0.15).astype(np.int8)[region],
+    })
+    return frame[spec['columns']]
+
+
+def replicate(frame, scale):
+    """Frame with every country repeated scale times under a new code, keeping the real scores."""
+    if scale == 1:
+        return frame
+    copies = []
+    for copy in range(scale):
+        part = frame.copy()
+        part['Code'] = part['Code'].astype(str) + ('' if copy == 0 else '-{}'.format(copy))
+        copies.append(part)
+    return pd.concat(copies, ignore_index=True)
+
+
+def write(output, regions, years, first_year=2000, seed=0):
+    """Writes synthetic-un.csv and synthetic-eu.csv to the output directory and returns their paths."""
+    output = pathlib.Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for layout in LAYOUTS:
+        path = output / 'synthetic-{}.csv'.format(layout)
+        generate(layout, regions, years, first_year, seed=seed).to_csv(path, index=False)
+        paths.append(path)
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--regions', type=int, default=1000)
+    parser.add_argument('--years', type=int, default=20)
+    parser.add_argument('--first-year', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='data/synthetic')
+    args = parser.parse_args()
+    for path in write(args.output, args.regions, args.years, args.first_year, args.seed):
+        print('Wrote {}'.format(path))
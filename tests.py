@@ -1,12 +1,40 @@
+import gzip
+import io
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
 import pytest
+import brotli
 import dash_html_components as html
+import numpy as np
 import pandas as pd
 
-from generators import generate_table, generate_europe_map, generate_world_map
-from app import DATA_UN, DATA_EU
+import benchmarks
+import columnar
+import correlation
+import indices
+import ingest
+import loadtest
+import prerender
+import serverprofile
+import synthetic
+from dataset import Countries, Dataset, frame_bytes
+from generators import generate_table, generate_europe_map, generate_world_map, generate_map, FigureCache, \
+    page_records, generate_year_arrays, figure_cache, cached_map, map_key, generate_year_update, generate_animated_map, \
+    cached_animated_map, ANIMATED, table_cache, response_cache
+from indices import INDICES, Index
+from metrics import memory_report
+from shared_cache import SharedCache
+from snapshot import Reloader, file_digest
+from warmup import WarmUp
+from app import DATA_DIR, DATA_UN, DATA_EU, server, reloader, load_data, drop_replaced_data, map_outputs, build_layout
 
-df = pd.read_csv('data/{}'.format(DATA_UN))
-dfeu = pd.read_csv('data/{}'.format(DATA_EU))
+df = pd.read_csv(os.path.join(DATA_DIR, DATA_UN))
+dfeu = pd.read_csv(os.path.join(DATA_DIR, DATA_EU))
 
 filtered_df = pd.DataFrame(df[df.Year == 2018], columns=['Czech name', 'eGov index']).reset_index()
 
@@ -75,3 +103,583 @@ def test_func_euromap(dataframe, year):
             assert False
         except Exception:
             assert True
+
+
+def callback_output(index):
+    """Output string of the map callback of the index, as sent by the browser."""
+    return '..' + '...'.join('{}.{}'.format(output.component_id, output.component_property)
+                             for output in map_outputs(index)) + '..'
+
+
+# checks that the slider callback only sends the changed properties of the map, matching the full figure
+def test_map_update():
+    index = INDICES['un']
+    data = reloader.current.datasets['un']
+    update = generate_year_update(index, data, 2016)
+    figure = generate_map(index, data, 2016)
+    assert update['title'] == figure.layout.title.text
+    assert update['colorbar'] == figure.data[0].colorbar.title.text
+    assert update['locations'] == list(figure.data[0].locations) and update['text'] == list(figure.data[0].text)
+    assert update['z'] == pytest.approx(list(figure.data[0].z), abs=5e-5)
+
+    response = server.test_client().post('/_dash-update-component', json={
+        'output': callback_output(index), 'outputs': None, 'changedPropIds': ['year-slider.value'],
+        'inputs': [{'id': 'year-slider', 'property': 'value', 'value': 2016}]})
+    sent = json.loads(response.data)['response']
+    assert sent[index.update_id]['data'] == update
+    assert len(json.dumps(update)) < len(figure.to_json()) / 2
+
+
+# checks that a repeated map callback is answered from its precompressed bytes with an ETag
+def test_cached_map_response():
+    client = server.test_client()
+    index = INDICES['eu']
+    request = {'output': callback_output(index), 'outputs': None, 'changedPropIds': [index.slider_id + '.value'],
+               'inputs': [{'id': index.slider_id, 'property': 'value', 'value': 2016}]}
+    response_cache.invalidate()
+    plain = client.post('/_dash-update-component', json=request)
+    hits = response_cache.hits
+    for encoding, decode in (('br', brotli.decompress), ('gzip', gzip.decompress)):
+        response = client.post('/_dash-update-component', json=request, headers={'Accept-Encoding': encoding})
+        assert response.headers['Content-Encoding'] == encoding and response.headers['ETag'] == plain.headers['ETag']
+        assert decode(response.data) == plain.data
+    assert response_cache.hits == hits + 2
+    assert json.loads(plain.data)['response'][index.update_id]['data']['title'].endswith('2016')
+    cached = client.post('/_dash-update-component', json=request, headers={'If-None-Match': plain.headers['ETag']})
+    assert cached.status_code == 304 and cached.data == b''
+    # Other years and unknown years are not answered from it
+    other = dict(request, inputs=[dict(request['inputs'][0], value=1990)])
+    assert client.post('/_dash-update-component', json=other).headers.get('ETag') is None
+
+
+# checks that the animated map has a compact frame per year, matching the map of that year, and is cached once
+def test_animated_map():
+    index = INDICES['eu']
+    data = reloader.current.datasets['eu']
+    figure = generate_animated_map(index, data)
+    assert [frame.name for frame in figure.frames] == [str(year) for year in data.years]
+    assert [step.label for step in figure.layout.sliders[0].steps] == [str(year) for year in data.years]
+    frame = figure.frames[data.years.index(2016)]
+    update = generate_year_update(index, data, 2016)
+    assert frame.layout.title.text == update['title'] and list(frame.data[0].locations) == update['locations']
+    assert list(frame.data[0].z) == pytest.approx(update['z'], nan_ok=True)
+    # Only the properties that change between years are repeated in every frame
+    assert set(frame.data[0].to_plotly_json()) == {'type', 'locations', 'z', 'text', 'colorbar'}
+    assert figure.layout.geo.scope == 'europe'
+    assert figure.data[0].colorscale == generate_map(index, data, 2016).data[0].colorscale
+
+    assert cached_animated_map(index, data) is cached_animated_map(index, data)
+    assert (map_key(index, data), ANIMATED) in figure_cache
+
+
+# checks that a map is styled by its registry entry and that every index gets its slider callback
+def test_index_registry():
+    index = Index('test', DATA_EU, 'EU eGov index', 'Test value', 'Test index ', 'Test source', 0, 100,
+                  geo=dict(scope='europe'), layout=dict(margin={'t': 0}))
+    fig = generate_map(index, dfeu, 2018)
+    assert fig.layout.title.text == 'Test index 2018'
+    assert fig.layout.geo.scope == 'europe' and fig.layout.margin.t == 0
+    assert (fig.data[0].zmin, fig.data[0].zmax) == (0, 100)
+    assert index.slider_id == 'test-year-slider' and index.store_id == 'test-map-years'
+
+    inputs = [dependency['inputs'] for dependency in server.test_client().get('/_dash-dependencies').get_json()]
+    for registered in INDICES.values():
+        assert [{'id': registered.slider_id, 'property': 'value'}] in inputs
+
+
+# checks that the figure cache builds each (dataset, year) once, stays within its size bound and can be invalidated
+def test_figure_cache():
+    cache = FigureCache(maxsize=2)
+    built = []
+
+    def build(year):
+        built.append(year)
+        return generate_world_map(df, year)
+
+    first = cache.get(DATA_UN, 2018, build)
+    assert cache.get(DATA_UN, 2018, build) is first
+    assert built == [2018]
+
+    cache.warm(DATA_UN, [2016, 2014], build)
+    assert len(cache) == 2
+    assert (DATA_UN, 2018) not in cache
+
+    cache.invalidate(DATA_EU)
+    assert len(cache) == 2
+    cache.invalidate(DATA_UN)
+    assert len(cache) == 0
+
+
+# checks that the dataset partitions match the boolean filters they replace
+def test_dataset_partitions():
+    data = Dataset(df, DATA_UN)
+    assert data.years == sorted(df['Year'].unique())
+    # Rows are held sorted by year and code
+    expected = df[df.Year == 2018].sort_values('Code', kind='mergesort').reset_index(drop=True)
+    assert data.year(2018).reset_index(drop=True).equals(expected)
+    assert data.year(1990).empty
+    czechia = data.country('CZE')
+    assert list(czechia['Year']) == sorted(df[df.Code == 'CZE']['Year'])
+    assert data.country('XXX').empty
+    assert data.year(2018) is data.year(2018)
+
+
+# checks that the table rounds float columns, keeps the others as they are and respects max_rows
+def test_table_formatting():
+    frame = pd.DataFrame({'Country': ['A', 'B', 'C'], 'Rank': [1, 2, 3], 'Value': [0.91234, 0.8, 0.755]})
+    table = generate_table(frame, 2)
+    rows = table.children[1].children
+    assert len(rows) == 2
+    assert [cell.children for cell in rows[0].children] == ['A', 1, 0.91]
+
+
+# checks that the paged table returns the requested page in the requested order
+def test_page_records():
+    frame = pd.DataFrame({'Country': ['A', 'B', 'C'], 'Value': [0.5, 0.912, 0.7]})
+    assert page_records(frame, 1, 2) == [{'Country': 'C', 'Value': 0.7}]
+    records = page_records(frame, 0, 2, [{'column_id': 'Value', 'direction': 'desc'}])
+    assert [record['Country'] for record in records] == ['B', 'C']
+    assert records[0]['Value'] == 0.91
+
+
+# checks that the rank and percentile precomputed for all years match ranking each year on its own
+def test_dataset_rankings():
+    data = Dataset(dfeu, DATA_EU, 'EU eGov index')
+    for year in data.years:
+        scores = dfeu[dfeu.Year == year].set_index('Code')['EU eGov index'].sort_index()
+        # Rows are held in their own order, they are matched by code
+        ranking = data.ranking(year).set_index(data.frame.loc[data.ranking(year).index, 'Code']).sort_index()
+        # Ranks are held as float32, which is exact for them
+        assert ranking['Rank'].astype(np.float64).equals(scores.rank(method='min', ascending=False))
+        assert ranking['Percentile'].equals(scores.rank(pct=True))
+        ordered = data.ranking(year)['EU eGov index']
+        assert ordered.is_monotonic_decreasing or ordered.isna().any()
+    assert 'Rank' not in dfeu.columns
+
+
+# checks that the compact per-year map arrays hold the same data as the server-side figure
+def test_year_arrays():
+    data = Dataset(df, DATA_UN, 'UN eGov index')
+    arrays = generate_year_arrays(data, 'UN eGovernment index ')
+    assert sorted(arrays['years']) == [str(year) for year in data.years]
+    trace = generate_world_map(data, 2018).data[0]
+    assert arrays['years']['2018']['locations'] == list(trace.locations)
+    assert arrays['years']['2018']['z'] == [round(value, 4) for value in trace.z]
+    assert [arrays['names'][name] for name in arrays['years']['2018']['text']] == list(trace.text)
+
+
+# checks that downloads are limited to the data index and support compression, conditional and range requests
+def test_download_route():
+    client = server.test_client()
+    assert client.get('/data/../app.py').status_code == 404
+    assert client.get('/data/%2e%2e/app.py').status_code == 404
+    assert DATA_UN in [data_file['name'] for data_file in client.get('/data/index.json').get_json()['files']]
+
+    with open(os.path.join(DATA_DIR, DATA_UN), 'rb') as source:
+        content = source.read()
+    compressed = client.get('/data/{}'.format(DATA_UN), headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == content
+    cached = client.get('/data/{}'.format(DATA_UN),
+                        headers={'Accept-Encoding': 'gzip', 'If-None-Match': compressed.headers['ETag']})
+    assert cached.status_code == 304
+
+    partial = client.get('/data/{}'.format(DATA_UN), headers={'Range': 'bytes=0-99'})
+    assert partial.status_code == 206 and partial.data == content[:100]
+
+
+# checks that the filtered export returns exactly the requested rows
+def test_export_route():
+    client = server.test_client()
+    response = client.get('/export/{}?year=2018&year=2016&code=CZE&code=SVK'.format(DATA_UN))
+    exported = pd.read_csv(io.BytesIO(response.data))
+    assert list(exported.columns) == list(df.columns)
+    assert len(exported) == 4 and set(exported['Code']) == {'CZE', 'SVK'}
+    assert len(pd.read_csv(io.BytesIO(client.get('/export/{}'.format(DATA_EU)).data))) == len(dfeu)
+    assert client.get('/export/{}?year=abc'.format(DATA_UN)).status_code == 400
+    assert client.get('/export/app.py').status_code == 404
+
+
+# checks the JSON API answers against the csv rows and that a client holding the current answer gets a 304
+def test_json_api():
+    client = server.test_client()
+    series = client.get('/api/v1/countries/cze').get_json()
+    assert series['name'] == 'Czech Republic' and set(series['indices']) == {'un', 'eu'}
+    czech = df[df['Code'] == 'CZE'].sort_values('Year')
+    assert [point['year'] for point in series['indices']['un']['series']] == czech['Year'].tolist()
+    assert [point['value'] for point in series['indices']['un']['series']] == czech['UN eGov index'].tolist()
+
+    matrix = client.get('/api/v1/un/matrix?code=CZE,SVK&code=XXX&year=2018&year=1999').get_json()
+    expected = df[(df['Year'] == 2018) & df['Code'].isin(['CZE', 'SVK'])].set_index('Code')['UN eGov index']
+    assert matrix['values'] == [[expected['CZE'], None], [expected['SVK'], None], [None, None]]
+
+    response = client.get('/api/v1/eu/rankings/2018')
+    ranking = response.get_json()['ranking']
+    assert [row['rank'] for row in ranking[:3]] == [1, 2, 3] and len(ranking) == len(dfeu[dfeu['Year'] == 2018])
+    assert client.get('/api/v1/eu/rankings/2018', headers={'If-None-Match': response.headers['ETag']}).status_code == 304
+    assert client.get('/api/v1/eu/rankings/1999').status_code == 404
+    assert client.get('/api/v1/xx/matrix').status_code == 404
+    assert client.get('/api/v1/un/matrix?year=abc').status_code == 400
+
+
+# checks that the compact frames keep the csv values in narrow dtypes over shared country categories, and the memory report
+def test_compact_memory():
+    countries = Countries([df, dfeu])
+    un, eu = countries.compact(df), countries.compact(dfeu)
+    assert un['Code'].cat.categories is eu['Code'].cat.categories
+    assert (un['Year'].dtype, un['EU28'].dtype, un['UN eGov index'].dtype) == (np.int16, np.int8, np.float64)
+    assert un.astype(object).where(un.notna(), None).equals(df.astype(object).where(df.notna(), None))
+    assert len(countries) == len(set(df['Code']) | set(dfeu['Code'])) and countries.table.loc['CZE', 'EU-code'] == 'CZ'
+    assert frame_bytes(un, {}) < df.memory_usage(deep=True).sum() / 5
+
+    snapshot = reloader.current
+    cached_map(INDICES['un'], snapshot.datasets['un'], 2018)
+    report = memory_report(snapshot.datasets, snapshot.countries, [figure_cache])
+    assert report['datasets']['un']['rows'] == len(df) and report['countries']['rows'] == len(countries)
+    # Code, EU-code, English name and Czech name, each held once for both indices
+    assert report['categories']['count'] == 4
+    assert report['caches']['figures']['entries'] == len(figure_cache) and report['caches']['figures']['bytes'] > 10000
+    raw = sum(sum(Dataset(frame, value_column=column).memory_usage().values())
+              for frame, column in [(df, 'UN eGov index'), (dfeu, 'EU eGov index')])
+    assert report['total'] - report['caches']['figures']['bytes'] < raw / 3
+
+
+# checks that the static export names files by their contents and only rebuilds the files of changed data
+def test_prerender(tmp_path):
+    result = prerender.export(tmp_path)
+    manifest = json.loads((tmp_path / 'manifest.json').read_text())['files']
+    assert {'un/2018.json', 'eu/figure.json', 'assets/prerender.js'} <= set(result['built']) == set(manifest)
+    for name, entry in manifest.items():
+        assert entry['file'] == prerender.content_name(name, (tmp_path / entry['file']).read_bytes())
+    year = json.loads((tmp_path / manifest['un/2018.json']['file']).read_text())
+    assert year['title'] == 'TOP 15 countries in 2018' and year['table'].startswith('<table>')
+    page = (tmp_path / 'index.html').read_text()
+    assert manifest['un/figure.json']['file'] in page and 'id="year-slider"' in page
+    # The download buttons and the map logo point at files of the bundle
+    assert 'href="{}"'.format(manifest['data/' + DATA_UN]['file']) in page and '"/data/' not in page
+    figure = json.loads((tmp_path / manifest['eu/figure.json']['file']).read_text())
+    assert figure['layout']['images'][0]['source'] == manifest['assets/Logo-icon.png']['file']
+
+    assert prerender.export(tmp_path)['built'] == []
+    # A change to one year of the EU data only rebuilds the file of that year
+    eu = reloader.current.datasets['eu']
+    frame = eu.frame[eu.columns].copy()
+    frame.loc[frame['Year'] == eu.years[0], eu.value_column] += 1
+    changed = reloader.current.replace(datasets=dict(reloader.current.datasets, eu=Dataset(
+        frame, eu.name, eu.value_column, 'changed')))
+    result = prerender.export(tmp_path, snapshot=changed)
+    assert result['built'] == ['eu/{}.json'.format(eu.years[0])]
+
+
+# checks that the export renders the tables a shared cache hands out as JSON like the built ones
+def test_prerender_shared_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(table_cache, 'shared', SharedCache(str(tmp_path / 'shared.sqlite')))
+    table_cache.invalidate()
+    built = prerender.export(tmp_path / 'built')
+    # Now every table comes from the shared cache as a dict
+    table_cache.invalidate()
+    shared = prerender.export(tmp_path / 'shared')
+    assert built['built'] == shared['built'] and table_cache.shared.hits > 0
+    for name in ('index.html', 'manifest.json'):
+        assert (tmp_path / 'built' / name).read_text() == (tmp_path / 'shared' / name).read_text()
+    assert '&#x27;props&#x27;' not in (tmp_path / 'shared' / 'index.html').read_text()
+    table_cache.invalidate()
+
+
+# checks that a wide release is appended as new rows only, and that stored years and unknown codes are refused
+def test_ingest(tmp_path, monkeypatch):
+    for name in (DATA_UN, DATA_EU):
+        shutil.copy(os.path.join(DATA_DIR, name), str(tmp_path / name))
+    monkeypatch.setattr(indices, 'DATA_DIR', str(tmp_path))
+    stored = (tmp_path / DATA_UN).read_bytes()
+    inode = (tmp_path / DATA_UN).stat().st_ino
+    (tmp_path / 'wide.csv').write_text('Code,2022,2024\nCZE,0.85,0.88\nsvk,0.8,\n')
+    result = ingest.ingest(INDICES['un'], str(tmp_path / 'wide.csv'))
+    assert result['years'] == [2022, 2024] and result['rows'] == 4
+    assert (tmp_path / DATA_UN).read_bytes().startswith(stored)
+    # Swapped in as a new file rather than written in place, without leaving the temporary file behind
+    assert (tmp_path / DATA_UN).stat().st_ino != inode and not list(tmp_path.glob('.*.tmp'))
+    data = Dataset.from_csv(str(tmp_path / DATA_UN), DATA_UN, 'UN eGov index')
+    assert data.years[-2:] == [2022, 2024] and len(data) == len(df) + 4
+    slovakia = data.country('SVK').set_index('Year')
+    assert slovakia.loc[2022, 'English name'] == 'Slovakia' and np.isnan(slovakia.loc[2024, 'UN eGov index'])
+    # The version id the app derives from the file contents
+    assert result['version'] == file_digest(str(tmp_path / DATA_UN))[:12] != result['previous_version']
+
+    appended = (tmp_path / DATA_UN).read_bytes()
+    (tmp_path / 'long.csv').write_text('Code,Year,Value\nCZE,2018,0.5\n')
+    with pytest.raises(ingest.IngestError, match='already in'):
+        ingest.ingest(INDICES['un'], str(tmp_path / 'long.csv'))
+    (tmp_path / 'long.csv').write_text('Code,Year,Value\nXYZ,2026,0.5\n')
+    with pytest.raises(ingest.IngestError, match='unknown country code'):
+        ingest.ingest(INDICES['un'], str(tmp_path / 'long.csv'))
+    assert (tmp_path / DATA_UN).read_bytes() == appended
+
+
+# replays a few sessions through the Flask server and checks every slider callback is measured without errors
+def test_loadtest():
+    report = loadtest.LoadTest(concurrency=2, sessions=3, moves=8, seed=3).run(loadtest.LocalClient)
+    callbacks = report['callbacks']
+    assert report['errors'] == 0 and report['requests'] == 3 * (len(loadtest.PAGE) + 8)
+    assert callbacks['page']['requests'] == callbacks['layout']['requests'] == 3
+    assert {'year-slider -> world-map-with-slider-update', 'correlation-year -> correlation-scatter'} <= set(callbacks)
+    assert all(callback['p50'] <= callback['p95'] <= callback['p99'] for callback in callbacks.values())
+    # The same seed replays the same sessions however the threads pick them up
+    counts = [{label: callback['requests'] for label, callback in loadtest.LoadTest(
+        concurrency=3, sessions=6, moves=8, seed=5).run(loadtest.LocalClient)['callbacks'].items()} for _ in range(2)]
+    assert counts[0] == counts[1]
+    assert [loadtest.percentile(list(range(1, 11)), share) for share in (10, 50, 95, 100)] == [1, 5, 10, 10]
+    assert loadtest.percentile([1, 2], 50) == 1 and loadtest.percentile([], 50) is None
+    rows = loadtest.compare(report, report)
+    assert all(row['throughput'] == 1 for row in rows) and rows[-1]['callback'] == 'all'
+
+
+# starts the production gunicorn profile and checks the forked workers serve and share the preloaded memory
+@pytest.mark.skipif(shutil.which('gunicorn') is None or not os.path.exists('/proc/self/smaps_rollup'),
+                    reason='needs gunicorn and the memory statistics of Linux')
+def test_server_profile():
+    result = serverprofile.measure('preload', workers=2, timeout=120)
+    print('Preload profile: ' + json.dumps(result))
+    assert result['memory']['processes'] == 3
+    assert result['memory']['pss_bytes'] < result['memory']['rss_bytes']
+
+
+# checks that the columnar copy loads back to the csv values and is ignored once the csv changes
+def test_columnar_roundtrip(tmp_path):
+    source = tmp_path / DATA_EU
+    shutil.copy(os.path.join(DATA_DIR, DATA_EU), str(source))
+    assert columnar.load(source) is None
+    columnar.build(source)
+    loaded = columnar.load(source)
+    assert loaded['Year'].dtype == 'int16' and loaded['Code'].dtype == 'category'
+    pd.testing.assert_frame_equal(loaded.astype(dfeu.dtypes.to_dict()), dfeu)
+
+    # Only the contents count, not the modification time an archive may round
+    os.utime(str(source), (0, 0))
+    assert columnar.load(source) is not None
+    content = source.read_text()
+    source.write_text(content.replace('2018', '2019', 1))
+    assert columnar.load(source) is None
+    assert columnar.read_frame(source).equals(pd.read_csv(str(source)))
+
+
+def import_breakdown(env):
+    """Imports the app in a fresh interpreter and returns the cumulative import time in seconds by module."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app; print(len(app.figure_cache))'],
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True,
+                            env=dict(os.environ, **env), check=True)
+    breakdown = {}
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:') and not line.endswith('imported package'):
+            _, cumulative, module = line[len('import time:'):].split('|')
+            breakdown[module.strip()] = int(cumulative) / 1e6
+    return breakdown, int(result.stdout.split()[-1])
+
+
+# measures the import time breakdown of the lazy start and checks that it skips the unused and deferred work
+def test_lazy_start_imports():
+    breakdown, cached_figures = import_breakdown({'EGOV_LAZY_START': '1'})
+    top_level = ['dash', 'dash_html_components', 'dash_core_components', 'pandas', 'dataset', 'generators', 'app']
+    print('Import time breakdown: ' + ', '.join('{} {:.3f}s'.format(name, breakdown[name]) for name in top_level))
+    assert cached_figures == 0
+    assert 'plotly.express' not in breakdown
+    # plotly.offline is pulled in by the first figure build, which the lazy start defers to the first request
+    assert 'plotly.offline' not in breakdown
+
+
+# runs the micro-benchmarks once on the real and 10x scaled data and checks them against the regression thresholds
+def test_benchmark_thresholds():
+    results = benchmarks.run(scales=(1, 10), repeat=1)
+    with open(benchmarks.THRESHOLDS) as thresholds:
+        limits = json.load(thresholds)
+    assert set(limits) <= set(results)
+    assert benchmarks.check(results, limits) == []
+
+
+# checks that the synthetic datasets follow the layout of the real ones and work with the whole pipeline
+def test_synthetic_datasets(tmp_path):
+    un_path, eu_path = synthetic.write(tmp_path, regions=300, years=5, first_year=2030)
+    generated = pd.read_csv(un_path)
+    assert list(generated.columns) == list(df.columns)
+    assert list(pd.read_csv(eu_path).columns) == list(dfeu.columns)
+    assert len(generated) == 1500 and generated['Code'].nunique() == 300
+    assert generated['UN eGov index'].between(0, 1).all()
+
+    data = Dataset.from_csv(un_path, 'synthetic-un.csv', 'UN eGov index')
+    assert data.years == list(range(2030, 2035))
+    assert len(data.ranking(2034)) == 300
+    generate_world_map(data, 2034)
+
+
+# checks the vectorized correlation statistics against numpy and that an update only recomputes the changed years
+def test_correlations():
+    frame = pd.read_csv(os.path.join(DATA_DIR, correlation.CORRELATION_FILE))
+    correlations = correlation.Correlations()
+    assert correlations.update(frame) == [correlation.POOLED, 2014, 2016, 2018]
+    for year in [correlation.POOLED] + correlations.years:
+        rows = frame if year == correlation.POOLED else frame[frame['Year'] == year]
+        x, y = rows[correlation.X_COLUMN], rows[correlation.Y_COLUMN]
+        statistics = correlations.statistics(year)
+        assert statistics['count'] == len(rows)
+        assert statistics['pearson'] == pytest.approx(np.corrcoef(x, y)[0, 1])
+        assert statistics['spearman'] == pytest.approx(np.corrcoef(x.rank(), y.rank())[0, 1])
+        assert [statistics['slope'], statistics['intercept']] == pytest.approx(np.polyfit(x, y, 1), abs=1e-9)
+    assert correlations.outliers(2014) == ['MLT']
+
+    changed = frame.copy()
+    changed.loc[changed['Year'] == 2016, correlation.Y_COLUMN] += 0.1
+    assert correlations.update(changed) == [correlation.POOLED, 2016]
+    assert correlations.update(changed) == []
+    assert correlations.update(changed[changed['Year'] != 2014]) == [correlation.POOLED]
+    assert correlations.years == [2016, 2018]
+
+
+# checks that the correlation callback is served for snapshots without correlation data, leaving the page as it is
+def test_correlation_without_data():
+    original = reloader.current
+    reloader.current = original.replace(correlations=correlation.Correlations())
+    try:
+        layout = repr(build_layout(reloader.current))
+        assert "id='correlation-year'" in layout and 'Correlation of the UN and EU' not in layout
+        response = server.test_client().post('/_dash-update-component', json={
+            'output': '..correlation-scatter.figure...correlation-statistics.children..', 'outputs': None,
+            'changedPropIds': ['correlation-year.value'],
+            'inputs': [{'id': 'correlation-year', 'property': 'value', 'value': correlation.POOLED}]})
+        assert response.status_code == 204
+    finally:
+        reloader.current = original
+    response = server.test_client().post('/_dash-update-component', json={
+        'output': '..correlation-scatter.figure...correlation-statistics.children..', 'outputs': None,
+        'changedPropIds': ['correlation-year.value'],
+        'inputs': [{'id': 'correlation-year', 'property': 'value', 'value': 2016}]})
+    assert response.status_code == 200
+
+
+# checks that a changed data file is loaded into a new snapshot next to the live one, reusing the unchanged data
+def test_hot_reload(tmp_path):
+    files = {}
+    for name, path in reloader.files.items():
+        files[name] = str(tmp_path / os.path.basename(path))
+        shutil.copyfile(path, files[name])
+    data_reloader = Reloader(files, load_data, drop_replaced_data)
+    first = data_reloader.current
+    eu = INDICES['eu']
+    cached_map(eu, first.datasets['eu'], 2018)
+    os.utime(files['un'], ns=(0, 0))
+    assert not data_reloader.reload()
+    assert data_reloader.current.datasets is first.datasets
+
+    release = pd.read_csv(files['eu'])
+    release.loc[(release['Year'] == 2018) & (release['Code'] == 'CZE'), 'EU eGov index'] = 99.5
+    release.to_csv(files['eu'], index=False)
+    assert data_reloader.changed()
+    data_reloader.reload_in_background().join()
+    second = data_reloader.current
+    assert second.version != first.version and data_reloader.reloads == 2
+    assert second.datasets['un'] is first.datasets['un']
+    assert second.correlations.computed == []
+    assert second.datasets['eu'].ranking(2018).iloc[0]['EU eGov index'] == 99.5
+    # Requests still holding the old snapshot keep seeing the old data
+    assert first.datasets['eu'].ranking(2018)['EU eGov index'].max() < 99.5
+    assert (map_key(eu, first.datasets['eu']), 2018) not in figure_cache
+
+
+# checks that the metrics route reports the callback latency and size, the cache hit counts and the data load
+def test_metrics_route():
+    client = server.test_client()
+    output = callback_output(INDICES['un'])
+    response = client.post('/_dash-update-component', json={
+        'output': output, 'outputs': None, 'changedPropIds': ['year-slider.value'],
+        'inputs': [{'id': 'year-slider', 'property': 'value', 'value': 2018}]})
+    assert response.status_code == 200
+
+    response = client.get('/metrics')
+    assert response.status_code == 200 and response.mimetype == 'text/plain'
+    values = dict(line.rsplit(' ', 1) for line in response.get_data(as_text=True).splitlines()
+                  if not line.startswith('#'))
+    label = '{{callback="{}"}}'.format(output)
+    assert int(values['egov_callback_duration_seconds_count' + label]) >= 1
+    assert float(values['egov_callback_duration_seconds_sum' + label]) > 0
+    assert float(values['egov_callback_response_bytes_sum' + label]) > 1000
+    # The slider callback looks up its map update and its table
+    for kind in ('update', 'table'):
+        assert int(values['egov_{}_cache_hits_total'.format(kind)]) + \
+            int(values['egov_{}_cache_misses_total'.format(kind)]) >= 1
+    assert float(values['egov_data_load_seconds']) > 0
+    assert float(values['egov_process_resident_memory_bytes']) > 0
+
+
+# checks that figures built by one worker are reused by another through the shared cache, within its size bound
+def test_shared_cache(tmp_path):
+    path = str(tmp_path / 'shared.sqlite')
+    builds = []
+
+    def build(year):
+        builds.append(year)
+        return generate_world_map(df, year)
+
+    worker, other_worker = FigureCache(), FigureCache()
+    worker.shared, other_worker.shared = SharedCache(path), SharedCache(path)
+    figure = worker.get('un@1', 2018, build, shared=True)
+    shared_figure = other_worker.get('un@1', 2018, build, shared=True)
+    assert shared_figure['layout']['title']['text'] == figure.layout.title.text
+    assert shared_figure['data'][0]['z'] == list(figure.data[0].z)
+    assert builds == [2018] and other_worker.shared.hits == 1
+    # Keys without a data version are never shared
+    other_worker.get('un', 2016, build)
+    assert builds == [2018, 2016] and len(worker.shared) == 1
+
+    small = SharedCache(str(tmp_path / 'small.sqlite'), max_bytes=2500)
+    errors = []
+
+    def fill(thread):
+        try:
+            for number in range(20):
+                small.put('{}/{}'.format(thread, number), bytes(100))
+                small.get('{}/{}'.format(thread, number))
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=fill, args=(thread,)) for thread in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert small.size() <= 2500 and len(small) == 25
+
+    # An unusable shared cache only costs the worker its own build
+    for broken in (SharedCache(str(tmp_path / 'missing' / 'shared.sqlite')), SharedCache(path, timeout=0.05)):
+        lock = sqlite3.connect(path, isolation_level=None)
+        lock.execute('BEGIN EXCLUSIVE')
+        try:
+            cache = FigureCache()
+            cache.shared = broken
+            assert cache.get('un@1', 2016, build, shared=True).layout.title.text.endswith('2016')
+            assert broken.errors >= 1 and broken.put('key', b'value') is False
+        finally:
+            lock.execute('ROLLBACK')
+
+
+# warms fresh caches on threads and on forked processes, a failing build leaves its entry to be built on demand
+@pytest.mark.parametrize('processes', [False, True])
+def test_warmup(processes):
+    # Smaller than the warm-up, which makes room for its entries
+    cache = FigureCache(maxsize=1)
+
+    def build(year):
+        if year == 2003:
+            raise ValueError(year)
+        return generate_world_map(df, year)
+
+    tasks = [('map/un/{}'.format(year), cache, 'un', year, build, False) for year in (2018, 2016, 2003)]
+    warmup = WarmUp(tasks, workers=2, processes=processes).start()
+    assert warmup.wait(60)
+    status = warmup.status()
+    assert (status['total'], status['done'], status['failed'], status['finished']) == (3, 2, 1, True)
+    assert status['evicted'] == 0 and cache.maxsize == 4
+    assert sorted(warmup.timings) == ['map/un/2016', 'map/un/2018']
+    assert len(cache) == 2 and ('un', 2003) not in cache
+    figure = cache.get('un', 2018, build)
+    assert cache.hits == 1
+    assert figure['layout']['title']['text'] if processes else figure.layout.title.text
@@ -0,0 +1,159 @@
+"""Parallel warm-up of the figure and table caches, in the background while the app already serves.
+
+Every task fills one cache entry with the same cache, key and builder a callback would use, so a
+callback asking for an entry that is not warm yet simply builds it on demand. Tasks run on a thread
+pool, or on a pool of forked processes that send the entries back serialized as JSON.
+"""
+import collections
+import concurrent.futures
+import json
+import multiprocessing
+import sys
+import threading
+import time
+
+import plotly
+
+# Tasks of the running process pool warm-up, inherited by the forked workers so only positions are sent to them
+_tasks = []
+
+
+def _build_serialized(position):
+    """Builds a task in a worker process, returning its build time and the entry as JSON."""
+    _, _, _, year, build, _ = _tasks[position]
+    start = time.perf_counter()
+    body = json.dumps(build(year), cls=plotly.utils.PlotlyJSONEncoder)
+    return time.perf_counter() - start, body
+
+
+class WarmUp(object):
+    """Builds the given cache entries on a pool and keeps its progress and timings.
+
+    tasks are (name, cache, key, year, build, shared) tuples, see generators.map_entry.
+    """
+
+    def __init__(self, tasks, workers=4, processes=False):
+        self.tasks = list(tasks)
+        # Every cache holds all of its entries the warm-up builds, so they do not evict each other
+        for cache, entries in collections.Counter(task[1] for task in self.tasks).items():
+            cache.reserve(entries)
+        self.workers = max(1, workers)
+        # Worker processes are forked, where that is not available the threads are used
+        self.processes = processes and 'fork' in multiprocessing.get_all_start_methods()
+        self.done = 0
+        self.failed = 0
+        # Entries built but no longer in their cache by the end, counted out of done
+        self.evicted = 0
+        # Build time of every finished task by its name
+        self.timings = {}
+        self.started = None
+        self.finished = None
+        self._finished = threading.Event()
+
+    @property
+    def total(self):
+        return len(self.tasks)
+
+    @property
+    def elapsed(self):
+        """Seconds since the warm-up started, up to its end once it finished."""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    def start(self):
+        """Runs the warm-up in a background thread and returns right away."""
+        # Worker processes are forked here rather than from the background thread, forking while
+        # another thread imports modules can leave the workers waiting on its import locks
+        self.started = time.perf_counter()
+        submitted = self._submit_processes() if self.processes else None
+        threading.Thread(target=self.run, args=(submitted,), name='cache-warmup', daemon=True).start()
+        return self
+
+    def wait(self, timeout=None):
+        """Waits for the warm-up to finish, returns whether it did."""
+        return self._finished.wait(timeout)
+
+    def status(self):
+        """Progress and timings of the warm-up."""
+        slowest = sorted(self.timings.items(), key=lambda timing: -timing[1])[:5]
+        return {
+            'total': self.total,
+            'done': self.done,
+            'failed': self.failed,
+            'evicted': self.evicted,
+            'finished': self._finished.is_set(),
+            'elapsed': round(self.elapsed, 3),
+            'build_seconds': round(sum(self.timings.values()), 3),
+            'slowest': [{'task': name, 'seconds': round(seconds, 3)} for name, seconds in slowest],
+        }
+
+    def run(self, submitted=None):
+        if self.started is None:
+            self.started = time.perf_counter()
+        try:
+            if self.processes:
+                self._run_processes(submitted or self._submit_processes())
+            else:
+                self._run_threads()
+        finally:
+            self.finished = time.perf_counter()
+            self._count_evicted()
+            print('Warmed {} of {} cache entries in {:.2f}s ({:.2f}s of builds on {} {})'.format(
+                self.done, self.total, self.elapsed, sum(self.timings.values()), self.workers,
+                'processes' if self.processes else 'threads'), file=sys.stderr)
+            if self.evicted:
+                print('{} warmed cache entries were evicted again, the caches are too small for the data'.format(
+                    self.evicted), file=sys.stderr)
+            # Set last, a process forked once wait() returns finds no thread of the warm-up busy
+            self._finished.set()
+
+    def _count_evicted(self):
+        # Entries of the callbacks can still push out warmed ones if the data is larger than the caches
+        built = [task for task in self.tasks if task[0] in self.timings]
+        self.evicted = sum(1 for _, cache, key, year, _, _ in built if (key, int(year)) not in cache)
+        self.done = len(built) - self.evicted
+
+    def _run_threads(self):
+        def build(task):
+            _, cache, key, year, build, shared = task
+            start = time.perf_counter()
+            cache.get(key, year, build, shared)
+            return time.perf_counter() - start
+
+        with concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix='warmup') as executor:
+            futures = {executor.submit(build, task): task for task in self.tasks}
+            for future in concurrent.futures.as_completed(futures):
+                self._record(futures[future], future)
+
+    def _submit_processes(self):
+        """Forks the worker processes and submits all tasks to them, returns the executor and the futures."""
+        _tasks[:] = self.tasks
+        executor = concurrent.futures.ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('fork'))
+        return executor, {executor.submit(_build_serialized, position): task for position, task in enumerate(self.tasks)}
+
+    def _run_processes(self, submitted):
+        executor, futures = submitted
+        try:
+            for future in concurrent.futures.as_completed(futures):
+                task = futures[future]
+                if future.exception() is None:
+                    _, cache, key, year, _, shared = task
+                    body = future.result()[1]
+                    # Entries built meanwhile by a callback are kept, the serialized one is used otherwise
+                    cache.get(key, year, lambda y: json.loads(body), shared)
+                self._record(task, future)
+        finally:
+            executor.shutdown()
+            del _tasks[:]
+
+    def _record(self, task, future):
+        error = future.exception()
+        if error is not None:
+            # The entry is then built on demand, as without the warm-up
+            self.failed += 1
+            print('Warm-up of {} failed: {!r}'.format(task[0], error), file=sys.stderr)
+            return
+        result = future.result()
+        self.timings[task[0]] = result[0] if isinstance(result, tuple) else result
+        self.done += 1